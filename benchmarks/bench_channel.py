@@ -0,0 +1,160 @@
+"""Benchmark of the receive path of the channel between the console reader and the host.
+
+Run it from the root of the repository (it runs on every platform, the console reader is replaced
+by a thread, which sends over a socket pair):
+
+    python -m benchmarks.bench_channel
+
+The host side receives the same console output in three ways:
+
+    raw        - The raw stream of the old protocol, for reference: every recv() allocates a new
+                 bytes object, which is scanned for the EOF character, split and decoded. There is
+                 no framing, no ACK and no logging in this path.
+    recv       - SpawnSocket.read_nonblocking() with the frames received by recv(), and fed into
+                 the FrameDecoder (a new bytes object per read, which is copied into its buffer).
+    recv_into  - SpawnSocket.read_nonblocking(): the frames are received right into the
+                 preallocated buffer of the FrameDecoder, the payloads are decoded from memoryviews.
+
+The framed paths differ only in the receive call: the framing, the ACK frames (with a receive
+window of 1 MB) and the logging cost the same in both. So 'raw' vs 'recv' is the cost of the
+protocol, and 'recv' vs 'recv_into' is the cost of the receive call.
+
+The allocations are measured with tracemalloc: the peak of the traced memory during each read is
+summed up, and divided by the received megabytes. The decoded text itself is 1 MB per MB (for
+ASCII output), everything above is the allocation of the receive path. The throughput is printed
+next to it, the best of three runs.
+"""
+
+import codecs
+import socket
+import threading
+import time
+import tracemalloc
+
+from wexpect.host import SpawnSocket
+from wexpect.wexpect_util import EOF
+from wexpect.wexpect_util import FrameDecoder
+from wexpect.wexpect_util import FRAME_DATA
+from wexpect.wexpect_util import FRAME_EOF
+from wexpect.wexpect_util import pack_frame
+
+EOF_CHAR = b'\x04'      # The end of the raw stream of the old protocol.
+MB = 1024 * 1024
+LINE = b'C:\\Users\\wexpect> dir /s /b C:\\Windows\\System32\\drivers\\etc\\hosts\r\n'
+
+
+class ChannelSpawn(SpawnSocket):
+    """A SpawnSocket connected to the given socket, without starting a console reader."""
+
+    def __init__(self, sock, maxread):
+        self.sock = sock
+        self.maxread = maxread
+        self.frames = FrameDecoder(maxread)
+        self.closed = False
+        self.flag_eof = False
+        self.encoding = 'UTF-8'
+        self.string_type = str
+        self.decode_errors = 'ignore'
+        self._decoder = codecs.getincrementaldecoder(self.encoding)(self.decode_errors)
+        self._ascii_compatible = True
+        self.receive_window = 1024 * 1024
+        self._unacknowledged = 0
+        self._send_lock = threading.Lock()
+        self._reader = None
+        self.child_process = None
+
+    def __del__(self):
+        pass
+
+
+class RecvChannelSpawn(ChannelSpawn):
+    """A ChannelSpawn, which receives the frames with recv() instead of recv_into()."""
+
+    def _read_frames(self, size):
+        s = self.sock.recv(size)
+        if not s:
+            self.flag_eof = True
+            raise EOF('Connection closed')
+        self.frames.feed(s)
+        return len(s)
+
+
+def read_recv(sock, size):
+    """The receive path of the old protocol."""
+    s = sock.recv(size)
+    if not s:
+        raise EOF('Connection closed')
+    if EOF_CHAR in s:
+        s = s.split(EOF_CHAR)[0]
+    return s.decode(encoding='UTF-8', errors='ignore')
+
+
+def sender(sock, chunk, total, framed):
+    """Sends the chunk (as DATA frames, if 'framed') until 'total' bytes are sent, like the
+    console reader does."""
+    message = pack_frame(FRAME_DATA, chunk) if framed else chunk
+    for _ in range(total // len(chunk)):
+        sock.sendall(message)
+    sock.sendall(pack_frame(FRAME_EOF) if framed else EOF_CHAR)
+    # Not closed yet, the host may still send ACK frames.
+    sock.shutdown(socket.SHUT_WR)
+
+
+PATHS = {
+    'raw': None,
+    'recv': RecvChannelSpawn,
+    'recv_into': ChannelSpawn,
+}
+
+
+def receive(path, total, maxread, measure):
+    """Receives 'total' bytes, and returns the elapsed time and the summed peak allocations."""
+    host, console = socket.socketpair()
+    chunk = LINE * (4096 // len(LINE))
+    spawn_class = PATHS[path]
+    thread = threading.Thread(target=sender, args=(console, chunk, total, spawn_class is not None))
+    spawn = spawn_class(host, maxread) if spawn_class is not None else None
+    allocated = 0
+    received = 0
+    start = time.perf_counter()
+    thread.start()
+    try:
+        while True:
+            if measure:
+                tracemalloc.reset_peak()
+                base = tracemalloc.get_traced_memory()[0]
+            if spawn is not None:
+                text = spawn.read_nonblocking(maxread)
+            else:
+                text = read_recv(host, maxread)
+            if measure:
+                allocated += tracemalloc.get_traced_memory()[1] - base
+            received += len(text)
+            if spawn is not None and spawn.flag_eof:
+                break
+            del text
+    except EOF:
+        pass
+    elapsed = time.perf_counter() - start
+    thread.join()
+    host.close()
+    console.close()
+    return received, elapsed, allocated
+
+
+def bench_receive(total=64 * MB):
+    print(f'Receiving {total // MB} MB console output over a socket pair')
+    print(f'{"maxread":>8} {"path":<10} {"MB/s":>8} {"KB allocated/MB":>16}')
+    for maxread in [4096, 60000]:
+        for path in PATHS:
+            elapsed = min(receive(path, total, maxread, measure=False)[1] for _ in range(3))
+            tracemalloc.start()
+            received, _, allocated = receive(path, total // 8, maxread, measure=True)
+            tracemalloc.stop()
+            throughput = total / MB / elapsed
+            per_mb = allocated / 1024 / (received / MB)
+            print(f'{maxread:>8} {path:<10} {throughput:>8.1f} {per_mb:>16.0f}')
+
+
+if __name__ == '__main__':
+    bench_receive()
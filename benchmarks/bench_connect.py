@@ -0,0 +1,90 @@
+"""Benchmark of the connection between the host and the console reader at spawn time.
+
+Run it from the root of the repository (it runs on every platform, the console reader is replaced
+by a thread, which comes up after a random start-up delay):
+
+    python -m benchmarks.bench_connect
+
+The host connects to the console reader in two ways:
+
+    polling    - The old way: the console reader listens, the host tries to connect, and sleeps
+                 0.2 s after each refused attempt (like SpawnPipe.connect_to_child() retried
+                 CreateFile).
+    readiness  - SpawnSocket.connect_to_child(): the host listens on an ephemeral port before it
+                 starts the console reader, which connects back as soon as it is up. The host
+                 waits in accept().
+
+The latency is the time from the moment the console reader is up to the established connection.
+"""
+
+import random
+import socket
+import statistics
+import threading
+import time
+
+POLL_INTERVAL = 0.2
+
+
+def console_listening(delay, port, ready):
+    """The console reader of the old way: it listens after its start-up delay."""
+    time.sleep(delay)
+    server = socket.create_server(('127.0.0.1', port))
+    ready.append(time.perf_counter())
+    connection, _ = server.accept()
+    connection.close()
+    server.close()
+
+
+def console_connecting(delay, port, ready):
+    """The console reader of the readiness handshake: it connects after its start-up delay."""
+    time.sleep(delay)
+    ready.append(time.perf_counter())
+    connection = socket.create_connection(('127.0.0.1', port))
+    connection.close()
+
+
+def connect_polling(delay):
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    ready = []
+    thread = threading.Thread(target=console_listening, args=(delay, port, ready))
+    thread.start()
+    while True:
+        try:
+            sock = socket.create_connection(('127.0.0.1', port))
+            break
+        except ConnectionRefusedError:
+            time.sleep(POLL_INTERVAL)
+    connected = time.perf_counter()
+    sock.close()
+    thread.join()
+    return connected - ready[0]
+
+
+def connect_readiness(delay):
+    listener = socket.create_server(('127.0.0.1', 0))
+    ready = []
+    thread = threading.Thread(
+        target=console_connecting, args=(delay, listener.getsockname()[1], ready))
+    thread.start()
+    sock, _ = listener.accept()
+    connected = time.perf_counter()
+    sock.close()
+    listener.close()
+    thread.join()
+    return connected - ready[0]
+
+
+def bench_connect(trials=20, max_delay=0.3):
+    print(f'Connecting {trials} times, the console reader starts up in 0-{max_delay} s')
+    print(f'{"method":<10} {"mean ms":>8} {"max ms":>8}')
+    delays = [random.uniform(0, max_delay) for _ in range(trials)]
+    for name, connect in [('polling', connect_polling), ('readiness', connect_readiness)]:
+        latencies = [connect(delay) * 1000 for delay in delays]
+        print(f'{name:<10} {statistics.mean(latencies):>8.1f} {max(latencies):>8.1f}')
+
+
+if __name__ == '__main__':
+    bench_connect()
@@ -0,0 +1,196 @@
+"""Benchmark of the console scraping of the console reader.
+
+Run it from the root of the repository (it runs on every platform, the console of the child is
+replaced by the SimulatedScreen of wexpect.screen):
+
+    python -m benchmarks.bench_scrape
+
+A ScriptedChild writes the scripted output into the simulated console at a fixed rate, and the
+console reader scrapes it with readConsoleToCursor() in every 20 ms tick of the (simulated) clock,
+like its read_loop() does. The CPU time of the scraping is measured with time.process_time(), the
+time of the simulated child is not counted. The cells read from the screen buffer are counted too:
+on Windows each read is a ReadConsoleOutputCharacter call into the console host.
+
+    output      - The CPU time of the scraping and the cells read per MB of child output, and the
+                  scraped MB. The scraped text is checked against the output, see check().
+    idle        - The CPU time of a tick and the cells read in a tick, while the child sits at its
+                  prompt.
+
+The next table compares the clearing of the console with the scroll-through mode (scroll_through),
+on a smaller screen buffer, which fills up many times:
+
+    clears      - The CPU time of the scraping, the times the console reader has cleared the
+                  console, when the cursor got beyond maxconsoleY, and the scraped characters. The
+                  read_loop() suspends the child for 0.2 s at each clearing, this is the stall.
+    scroll      - The CPU time of the scraping in the scroll-through mode, the rows scrolled out
+                  of the console (see ConsoleReaderBase.scrollConsole()), and the scraped
+                  characters. The child is not stalled.
+
+The scraped text of both modes is checked against the output.
+
+The last line is the time of parseData() on a whole 16000 x 80 screen buffer full of short lines,
+what the console reader parses, when a child has written much output between two ticks.
+"""
+
+import time
+import timeit
+
+from wexpect import console_reader
+from wexpect.console_reader import ConsoleReaderBase
+from wexpect.console_reader import screenbufferfillchar
+from wexpect.screen import Coord
+from wexpect.screen import ScriptedChild
+from wexpect.screen import SimulatedScreen
+
+MB = 1024 * 1024
+TICK = 0.02                 # The period of the read_loop() of the console reader.
+STALL = 0.2                 # The time the read_loop() suspends the child to clear the console.
+RATE = 1 * MB               # Characters per second written by the child.
+
+SCRIPTS = {
+    'short lines': lambda i: 'C:\\Windows\\System32\\drivers\\etc\\hosts %d\r\n' % i,
+    'wrapped lines': lambda i: ('%d ' % i) * 60 + '\r\n',
+    'progress': lambda i: '\rDownloading... %3d%% [%-40s]' % (i % 100, '#' * (i % 40)) + (
+        '\r\n' if i % 100 == 99 else ''),
+    # A test runner, which prints a dot per test, the lines are wrapped into many rows.
+    'dots': lambda i: '.' * 50 + ('\r\n' if i % 40 == 39 else ''),
+    # Lines of 20000 characters (250 rows), like a long JSON document without line breaks.
+    'long lines': lambda i: '.' * 100 + ('\r\n' if i % 200 == 199 else ''),
+}
+
+
+class CountingScreen(SimulatedScreen):
+    """A SimulatedScreen, which counts the cells read."""
+
+    cells = 0
+
+    def read_characters(self, length, coord):
+        self.cells += length
+        return super().read_characters(length, coord)
+
+
+class SimulatedConsoleReader(ConsoleReaderBase):
+    """A console reader, which scrapes a SimulatedScreen, without the child and the host."""
+
+    def __init__(self, screen, scroll_through=False):
+        self.scroll_through = scroll_through
+        size = screen.get_size()
+        self.initConsole(screen, buffer_size_x=size.X, buffer_size_y=size.Y)
+
+    def suspend_child(self):
+        """The simulated child is not paused."""
+
+    def resume_child(self):
+        pass
+
+
+def render(s):
+    """Returns the lines of s, as a terminal shows them: a carriage return starts overwriting
+    the line."""
+    lines = []
+    for line in s.split('\r\n'):
+        row = ''
+        for part in line.split('\r'):
+            row = part + row[len(part):]
+        lines.append(row)
+    return '\r\n'.join(lines)
+
+
+def check(name, output, scraped):
+    """Raises AssertionError, if the scraped text is not the output of the script. The progress
+    bar is redrawn many times in a tick, and the scraper sees only the last one, so its lines are
+    compared as a terminal shows them."""
+    if name == 'progress':
+        ok = render(scraped) == render(output)
+    else:
+        ok = scraped == output
+    if not ok:
+        raise AssertionError(f'{name}: the scraped text differs from the output')
+
+
+def make_output(script, size):
+    lines = []
+    length = 0
+    while length < size:
+        lines.append(script(len(lines)))
+        length += len(lines[-1])
+    return ''.join(lines)
+
+
+def scrape(output, rate=RATE, idle_ticks=0, scroll_through=False, buffer_size_y=16000):
+    """Returns the CPU time and the cells read of the scraping, the scraped text, the CPU time
+    and the cells read of the idle ticks, and the reader."""
+    clock = [0.0]
+    screen = CountingScreen(buffer_size_y=buffer_size_y)
+    reader = SimulatedConsoleReader(screen, scroll_through)
+    reader.clears = 0
+    child = ScriptedChild(screen, output, rate, clock=lambda: clock[0])
+    # The clearing starts at the same fraction of the buffer as in the read_loop().
+    maxconsoleY = buffer_size_y * console_reader.maxconsoleY // 16000
+    cpu = 0.0
+    scraped = []
+    while not child.done():
+        clock[0] += TICK
+        child.step()
+        start = time.process_time()
+        if screen.get_cursor_position().Y > maxconsoleY:
+            scraped.append(reader.readConsoleToCursor())
+            if scroll_through:
+                reader.scrollConsole()
+            else:
+                reader.refresh_console()
+                reader.clears += 1
+        else:
+            scraped.append(reader.readConsoleToCursor())
+        cpu += time.process_time() - start
+    scraped.append(reader.readConsoleToCursor())
+    scraped = ''.join(scraped)
+    cells = screen.cells
+    start = time.process_time()
+    for _ in range(idle_ticks):
+        reader.readConsoleToCursor()
+    idle = time.process_time() - start
+    return cpu, cells, scraped, idle, screen.cells - cells, reader
+
+
+def bench_scrape(size=4 * MB, idle_ticks=2000, buffer_size_y=2000):
+    print(f'Scraping {size // MB} MB child output written at {RATE // MB} MB/s')
+    print(f'{"script":<14} {"CPU ms/MB":>10} {"cells/MB":>10} {"scraped MB":>11}'
+          f' {"idle us/tick":>13} {"idle cells/tick":>16}')
+    for name, script in SCRIPTS.items():
+        output = make_output(script, size)
+        cpu, cells, scraped, idle, idle_cells, _ = scrape(output, idle_ticks=idle_ticks)
+        check(name, output, scraped)
+        mb = len(output) / MB
+        print(f'{name:<14} {cpu * 1000 / mb:>10.1f} {cells / mb:>10.0f} {len(scraped) / MB:>11.2f}'
+              f' {idle * 1e6 / idle_ticks:>13.1f} {idle_cells / idle_ticks:>16.1f}')
+
+    print(f'Clearing and scroll-through on a 80 x {buffer_size_y} screen buffer')
+    print(f'{"script":<14} {"CPU ms/MB":>10} {"clears":>7} {"stall s":>8} {"scraped":>8}'
+          f' {"scroll CPU ms/MB":>17} {"rows scrolled":>14} {"scraped":>8}')
+    for name, script in SCRIPTS.items():
+        output = make_output(script, size)
+        mb = len(output) / MB
+        cpu, _, scraped, _, _, reader = scrape(output, buffer_size_y=buffer_size_y)
+        scroll_cpu, _, scroll_scraped, _, _, scroll_reader = scrape(
+            output, scroll_through=True, buffer_size_y=buffer_size_y)
+        check(name, output, scraped)
+        check(name, output, scroll_scraped)
+        stall = reader.clears * STALL
+        print(f'{name:<14} {cpu * 1000 / mb:>10.1f} {reader.clears:>7} {stall:>8.1f}'
+              f' {len(scraped):>8} {scroll_cpu * 1000 / mb:>17.1f}'
+              f' {scroll_reader.scrolledRows:>14} {len(scroll_scraped):>8}')
+
+    screen = SimulatedScreen()
+    reader = SimulatedConsoleReader(screen)
+    screen.fill_characters(screenbufferfillchar, 80 * 16000, Coord(0, 0))
+    screen.put(make_output(SCRIPTS['short lines'], 16000 * 42)[:-2])
+    s = screen.read_characters(80 * 16000, Coord(0, 0))
+    reader.totalRead = reader.lastRead = len(s)
+    number = 5
+    elapsed = min(timeit.repeat(lambda: reader.parseData(s), number=number, repeat=3)) / number
+    print(f'parseData of a whole screen: {elapsed * 1000:.1f} ms')
+
+
+if __name__ == '__main__':
+    bench_scrape()
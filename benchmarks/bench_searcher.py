@@ -0,0 +1,111 @@
+"""Benchmarks of the searcher_re and searcher_string helpers.
+
+Run it from the root of the repository:
+
+    python -m benchmarks.bench_searcher
+
+The prefilter benchmark compares the searches with and without the required-literal prefilter
+over large buffers, which do not contain the literals.
+
+The tail benchmark shows, that the search time of an end anchored prompt pattern (like '> $')
+does not depend on the size of the buffer.
+
+The fusion benchmark compares the per-pattern search (fuse=False) to the default search
+(fuse=True), which fuses the patterns sharing their possible first characters into an alternation,
+for growing pattern lists of different shapes. The gain is the ratio of the two times. It is about
+1 for a few patterns (except the end anchored prompts: up to 2, but they take microseconds anyway),
+and 3-4 for 32-64 patterns sharing their first characters. 'units' is the number of the separate
+regexes after the fusion. (The alternation of all the patterns, regardless of their first
+characters, was never faster than the separate searches in this benchmark, but up to 3 times
+slower, so searcher_re does not offer it.)
+"""
+
+import random
+import re
+import timeit
+
+from wexpect.host import searcher_re
+
+WORDS = ['Password', 'login', 'Username', 'continue', 'ERROR', 'Warning', 'fatal', 'Are you sure',
+         'press any key', 'retry', 'abort', 'yes/no', 'Enter', 'choice', 'done', 'failed']
+
+# Pattern factories. The first two share the set of the first characters. The literals of the third
+# one start with the words, so some of them share their first character, and from 17 patterns on
+# the words repeat. The groups of the last one start with two different words, so they do not.
+SHAPES = {
+    'same prefix': lambda i: r'prompt%d> $' % i,
+    'same class': lambda i: r'[\[\(](\d+)%%\] %s' % WORDS[i % len(WORDS)],
+    'literals': lambda i: re.escape(WORDS[i % len(WORDS)] + str(i)) + r':\s*$',
+    'distinct groups': lambda i: r'(?:%s|%s)\s+%d' % (
+        WORDS[i % len(WORDS)], WORDS[(i + 5) % len(WORDS)], i),
+}
+
+PATTERN_COUNTS = [1, 2, 3, 4, 6, 8, 16, 32, 64]
+
+
+def make_buffer(size=200000, seed=0):
+    rnd = random.Random(seed)
+    return ''.join(rnd.choice('abcdefghijklmnopqrstuvwxyz  [(\r\n0123456789') for _ in range(size))
+
+
+# Typical expect() patterns with a mandatory literal.
+PREFILTER_PATTERNS = [
+    r'Password:\s*$',
+    r'\[(\d+)%\] done',
+    r'(\d+) files? copied',
+    r'\s+ERROR:\s+(.*)$',
+    r'[A-Z]:\\[^>]*>$',
+]
+
+
+def time_search(patterns, buffer, fuse=True, prefilter=True, number=5):
+    searcher = searcher_re(patterns, fuse=fuse, prefilter=prefilter)
+    # freshlen == len(buffer): every search starts from scratch.
+    return timeit.timeit(lambda: searcher.search(buffer, len(buffer)), number=number) / number
+
+
+def bench_fusion():
+    buffer = make_buffer()
+    print(f'searcher_re over a non-matching buffer of {len(buffer)} characters (ms/search)')
+    for name, factory in SHAPES.items():
+        print(f'\n{name}: e.g. {factory(0)!r}')
+        print(f'{"patterns":>8} {"units":>6} {"separate":>10} {"fused":>10} {"gain":>6}')
+        for count in PATTERN_COUNTS:
+            patterns = [re.compile(factory(i), re.DOTALL) for i in range(count)]
+            units = len(searcher_re(patterns)._units)
+            separate = time_search(patterns, buffer, fuse=False)
+            fused = time_search(patterns, buffer, fuse=True)
+            print(f'{count:>8} {units:>6} {separate * 1000:>10.3f} {fused * 1000:>10.3f}'
+                  f' {separate / fused:>6.2f}')
+
+
+def bench_prefilter():
+    print('searcher_re with and without the required-literal prefilter (ms/search)')
+    print(f'{"buffer":>10} {"pattern":<24} {"regex only":>10} {"prefilter":>10}')
+    for size in [10000, 100000, 1000000]:
+        # Digits and spaces: the regexes have to try many positions, but the literals are absent.
+        buffer = make_buffer(size).replace('%', '')
+        for source in PREFILTER_PATTERNS:
+            patterns = [re.compile(source, re.DOTALL)]
+            plain = time_search(patterns, buffer, fuse=False, prefilter=False)
+            filtered = time_search(patterns, buffer, fuse=False, prefilter=True)
+            print(f'{size:>10} {source:<24} {plain * 1000:>10.3f} {filtered * 1000:>10.3f}')
+
+
+def bench_tail():
+    print('searcher_re with end anchored prompt patterns (ms/search)')
+    print(f'{"buffer":>10} {"pattern":<24} {"search":>10}')
+    for size in [10000, 100000, 1000000]:
+        buffer = make_buffer(size) + 'C:\\> dir'
+        for source in [r'> $', r'\$ $', r'[A-Z]:\\[^>]{0,64}>$']:
+            patterns = [re.compile(source, re.DOTALL)]
+            elapsed = time_search(patterns, buffer)
+            print(f'{size:>10} {source:<24} {elapsed * 1000:>10.3f}')
+
+
+if __name__ == '__main__':
+    bench_tail()
+    print()
+    bench_prefilter()
+    print()
+    bench_fusion()
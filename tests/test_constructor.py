@@ -31,6 +31,18 @@ class TestCaseConstructor(PexpectTestCase.PexpectTestCase):
         p = wexpect.spawn(args=[], command='ls')
         p.wait()
 
+    @unittest.skipIf(wexpect.spawn_class_name == 'legacy_wexpect', "legacy unsupported")
+    def test_ephemeral_port (self):
+        '''This tests that socket spawns with port=0 get their own ports, and can start at the
+        same time.
+        '''
+        spawns = [wexpect.SpawnSocket('echo hello', port=0, timeout=10) for _ in range(8)]
+        self.assertEqual(len({p.port for p in spawns}), len(spawns))
+        for p in spawns:
+            self.assertNotEqual(p.port, 0)
+            p.expect('hello')
+            p.wait()
+
 if __name__ == '__main__':
     unittest.main()
 
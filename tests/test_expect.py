@@ -169,6 +169,39 @@ class ExpectTestCase (PexpectTestCase.PexpectTestCase):
         if wexpect.spawn_class_name == 'SpawnSocket':
             p.wait()
 
+    def test_expect_pattern_set (self):
+        '''This tests that a precompiled PatternSet can be expected many times.
+        '''
+        p = wexpect.spawn('cat', timeout=5, echo=False)
+        patterns = wexpect.compile_patterns(['abcd', 'wxyz', wexpect.TIMEOUT, wexpect.EOF])
+        self.assertEqual(patterns.timeout_index, 2)
+        self.assertEqual(patterns.eof_index, 3)
+        for _ in range(3):
+            p.sendline ('wxyz')
+            index = p.expect (patterns)
+            self.assertEqual(index,  1, "index="+str(index))
+        index = p.expect (patterns, timeout=1)
+        self.assertEqual(index,  2, "index="+str(index))
+        p.sendeof ()
+        index = p.expect (patterns)
+        self.assertEqual(index,  3, "index="+str(index))
+
+    def test_expect_pattern_set_kind (self):
+        '''This tests that a PatternSet is expected only by its own method, with the ignorecase
+        of the spawn.
+        '''
+        p = wexpect.spawn('cat', timeout=5, echo=False)
+        with self.assertRaises(TypeError):
+            p.expect_exact(wexpect.compile_patterns(['a.c']))
+        with self.assertRaises(TypeError):
+            p.expect(wexpect.compile_patterns(['a.c'], exact=True))
+        with self.assertRaises(ValueError):
+            p.expect(wexpect.compile_patterns(['abc'], ignorecase=True))
+        p.ignorecase = True
+        p.sendline ('ABC')
+        index = p.expect (wexpect.compile_patterns(['abc', wexpect.EOF], ignorecase=True))
+        self.assertEqual(index,  0, "index="+str(index))
+
     def _expect_index (self, p):
         p.sendline ('1234')
         index = p.expect (['abcd','wxyz','1234',wexpect.EOF])
@@ -399,6 +432,53 @@ class ExpectTestCase (PexpectTestCase.PexpectTestCase):
         with self.assertRaisesRegex(TypeError, '.*must be one of'):
             p.expect_exact([1, '2'])
 
+    def test_multibyte_small_maxread(self):
+        '''The multibyte characters split between the reads are decoded.'''
+        p = wexpect.spawn('cat', timeout=5, echo=False, maxread=1)
+        p.sendline('\u03b1\u03b2\u03b3 \u03b4\u03b5')
+        p.expect('\u03b1\u03b2\u03b3 \u03b4\u03b5')
+
+    def test_bytes_mode(self):
+        '''With encoding=None the output is not decoded, it is searched by bytes patterns.'''
+        p = wexpect.spawn('cat', timeout=5, echo=False, encoding=None)
+        p.sendline(b'abc \xce\xb1 def')
+        self.assertEqual(p.expect([b'\xce\xb1', wexpect.EOF]), 0)
+        self.assertEqual(p.before, b'abc ')
+        self.assertEqual(p.after, b'\xce\xb1')
+        p.expect_exact(b'def')
+        self.assertEqual(p.readline(), b'\r\n')
+        with self.assertRaises(TypeError):
+            p.expect('abc')
+
+    def test_reader_thread(self):
+        '''The reader thread reads the output, while expect() is not called.'''
+        p = wexpect.spawn(PYTHONBINQUOTE + ' list100.py', timeout=5, reader_thread=True)
+        time.sleep(2)
+        self.assertIn('99]', p.buffer)
+        p.expect_exact('99]')
+        p.expect(wexpect.EOF)
+        self.assertEqual(p.wait(), 0)
+
+    def test_maxbuffersize(self):
+        p = wexpect.spawn('cat', timeout=5, echo=False, maxbuffersize=50)
+        p.sendline('x' * 200)
+        index = p.expect(['never', wexpect.TIMEOUT], timeout=2)
+        self.assertEqual(index, 1)
+        self.assertEqual(len(p.buffer), 50)
+        self.assertGreater(p.buffer_overflows, 0)
+        self.assertGreater(p.buffer_dropped, 100)
+        p.sendline('abcd')
+        p.expect('abcd')
+
+    def test_maxbuffersize_raise(self):
+        p = wexpect.spawn('cat', timeout=5, echo=False, maxbuffersize=50, overflow='raise')
+        p.sendline('x' * 200)
+        with self.assertRaises(wexpect.BufferOverflow):
+            p.expect('never')
+        self.assertEqual(p.buffer_dropped, 0)
+        with self.assertRaises(ValueError):
+            wexpect.spawn('cat', overflow='unknown')
+
     def test_timeout_none(self):
         p = wexpect.spawn('echo abcdef', timeout=None)
         p.expect('abc')
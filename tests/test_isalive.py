@@ -68,6 +68,28 @@ class IsAliveTestCase(PexpectTestCase.PexpectTestCase):
         p.expect(wexpect.EOF)
         assert not p.isalive()
 
+    def test_exit_status_from_console(self):
+        '''The console reader sends the exit status at the end of the output, the host does not
+        have to wait for the process.'''
+        p = wexpect.spawn(PYBIN + ' exit1.py')
+        p.expect(wexpect.EOF)
+        self.assertEqual(p.exitstatus, 1)
+        assert not p.isalive()
+        self.assertEqual(p.wait(), 1)
+        self.assertGreaterEqual(p.child_runtime, 0)
+
+    def test_wait_maxbuffersize(self):
+        '''wait() and isalive() do not read the output beyond maxbuffersize, the process is
+        polled then, and the rest of the output is left for expect().'''
+        for reader_thread in (False, True):
+            p = wexpect.spawn(PYBIN + ' list100.py', maxread=100, maxbuffersize=50,
+                              reader_thread=reader_thread)
+            self.assertEqual(p.wait(), 0)
+            assert not p.isalive()
+            self.assertLessEqual(len(p.buffer), 50 + 100)
+            p.expect_exact('99]')
+            p.expect(wexpect.EOF)
+
 ### Some platforms allow this. Some reset status after call to waitpid.
 ### probably not necessary, isalive() returns early when terminate is False.
     def test_expect_isalive_consistent_multiple_calls (self):
@@ -0,0 +1,240 @@
+import socket
+import unittest
+
+from wexpect.wexpect_util import ProtocolError
+from wexpect.wexpect_util import FrameDecoder
+from wexpect.wexpect_util import FRAME_HELLO
+from wexpect.wexpect_util import FRAME_DATA
+from wexpect.wexpect_util import FRAME_EOF
+from wexpect.wexpect_util import FRAME_SIGNAL
+from wexpect.wexpect_util import FRAME_ACK
+from wexpect.wexpect_util import SIGNAL_PAYLOAD
+from wexpect.wexpect_util import ACK_PAYLOAD
+from wexpect.wexpect_util import FlowControl
+from wexpect.wexpect_util import pack_frame
+from wexpect.wexpect_util import pack_hello
+from wexpect.wexpect_util import unpack_hello
+from wexpect.wexpect_util import negotiate_version
+from tests import PexpectTestCase
+
+
+def read_all(decoder, handle_frame=None):
+    " the DATA payloads, which have arrived, like the host reads them without receiving more "
+    data = b''
+    while decoder.ready():
+        data += decoder.read_data(handle_frame)
+    return data
+
+
+class FrameTestCase(PexpectTestCase.PexpectTestCase):
+
+    def frames(self, decoder):
+        result = []
+        while True:
+            frame = decoder.next_frame()
+            if frame is None:
+                return result
+            result.append((frame[0], bytes(frame[1])))
+
+    def test_roundtrip(self):
+        " the payloads are not scanned, EOF and signal characters are kept "
+        stream = (pack_frame(FRAME_DATA, b'abc\x04def\x011')
+                  + pack_frame(FRAME_SIGNAL, SIGNAL_PAYLOAD.pack(2))
+                  + pack_frame(FRAME_DATA, b'')
+                  + pack_frame(FRAME_EOF))
+        decoder = FrameDecoder()
+        decoder.feed(stream)
+        self.assertEqual(self.frames(decoder), [
+            (FRAME_DATA, b'abc\x04def\x011'),
+            (FRAME_SIGNAL, SIGNAL_PAYLOAD.pack(2)),
+            (FRAME_DATA, b''),
+            (FRAME_EOF, b'')])
+        self.assertEqual(len(decoder), 0)
+
+    def test_partial_frames(self):
+        " a frame is returned only when it has been completely arrived "
+        stream = pack_frame(FRAME_DATA, b'hello') + pack_frame(FRAME_DATA, b'world')
+        decoder = FrameDecoder()
+        frames = []
+        for i in range(len(stream)):
+            decoder.feed(stream[i:i + 1])
+            frames += self.frames(decoder)
+            if i < 9:
+                self.assertEqual(frames, [])
+        self.assertEqual(frames, [(FRAME_DATA, b'hello'), (FRAME_DATA, b'world')])
+
+    def test_recv_into(self):
+        " the stream is received into the same buffer, the payloads are views of it "
+        host, console = socket.socketpair()
+        decoder = FrameDecoder(64)
+        for i in range(100):
+            console.sendall(pack_frame(FRAME_DATA, b'line %d\r\n' % i))
+        console.sendall(pack_frame(FRAME_EOF))
+        console.close()
+        buffer = decoder.data
+        frames = []
+        while True:
+            n = host.recv_into(decoder.writable(10))
+            if not n:
+                break
+            decoder.commit(n)
+            frames += self.frames(decoder)
+        host.close()
+        self.assertIs(decoder.data, buffer)
+        self.assertEqual(len(frames), 101)
+        self.assertEqual(frames[42], (FRAME_DATA, b'line 42\r\n'))
+        self.assertEqual(frames[-1], (FRAME_EOF, b''))
+
+    def test_read_data(self):
+        " the DATA payloads are returned in place, the other frames are handled in order "
+        decoder = FrameDecoder(16)
+        decoder.feed(pack_frame(FRAME_DATA, b'abc') + pack_frame(FRAME_SIGNAL, b'\x02\0\0\0')
+                     + pack_frame(FRAME_DATA, b'') + pack_frame(FRAME_DATA, b'def')
+                     + pack_frame(FRAME_EOF) + pack_frame(FRAME_DATA, b'gh')[:-1])
+        other = []
+        payloads = []
+        while decoder.ready():
+            data = decoder.read_data(lambda kind, payload: other.append((kind, bytes(payload))))
+            self.assertIs(data.obj, decoder.data)
+            payloads.append(bytes(data))
+        self.assertEqual(payloads, [b'abc', b'def', b'g'])
+        self.assertEqual(other, [(FRAME_SIGNAL, b'\x02\0\0\0'), (FRAME_EOF, b'')])
+        self.assertEqual(bytes(decoder.read_data(None)), b'')
+        decoder.feed(b'h' + pack_frame(FRAME_DATA, b'ij'))
+        self.assertEqual(read_all(decoder), b'hij')
+        self.assertFalse(decoder.ready())
+        decoder.feed(pack_frame(FRAME_SIGNAL, b'\x02\0\0\0')[:-1])
+        self.assertFalse(decoder.ready())
+
+    def test_read_data_split(self):
+        " the data of a DATA frame is returned as it arrives, even in the middle of a character "
+        text = '\u03b1\u03b2\u03b3 abc \u03b4'.encode('utf-8')
+        stream = pack_frame(FRAME_DATA, text) + pack_frame(FRAME_EOF)
+        decoder = FrameDecoder(8)
+        chunks = []
+        for i in range(len(stream)):
+            decoder.feed(stream[i:i + 1])
+            chunks.append(read_all(decoder, lambda kind, payload: chunks.append(kind)))
+        self.assertEqual(b''.join(c for c in chunks if isinstance(c, bytes)), text)
+        self.assertIn(FRAME_EOF, chunks)
+
+    def test_unknown_frame(self):
+        " a raw (not framed) stream is refused "
+        decoder = FrameDecoder()
+        decoder.feed(b'Microsoft Windows')
+        with self.assertRaises(ProtocolError):
+            decoder.next_frame()
+
+    def test_hello(self):
+        decoder = FrameDecoder()
+        decoder.feed(pack_hello((1, 2, 3)))
+        kind, payload = decoder.next_frame()
+        self.assertEqual(kind, FRAME_HELLO)
+        self.assertEqual(unpack_hello(payload), (1, 2, 3))
+        with self.assertRaises(ProtocolError):
+            unpack_hello(b'HELLO\x01')
+
+    def test_negotiate_version(self):
+        self.assertEqual(negotiate_version((1, 2, 3), (1, 2)), 2)
+        with self.assertRaises(ProtocolError):
+            negotiate_version((2, 3), (1,))
+
+
+class FakeChild:
+    " a child, which writes a line into the console in every tick, unless it is suspended "
+
+    def __init__(self):
+        self.suspended = False
+        self.console = []
+        self.lines = 0
+
+    def suspend(self):
+        self.suspended = True
+
+    def resume(self):
+        self.suspended = False
+
+    def tick(self):
+        if not self.suspended:
+            self.console.append(b'line %d\r\n' % self.lines)
+            self.lines += 1
+
+
+class FlowControlTestCase(PexpectTestCase.PexpectTestCase):
+
+    def test_window(self):
+        " the child is suspended while the window is exhausted, and resumed by the credit "
+        clock = [0.0]
+        child = FakeChild()
+        flow = FlowControl(child.suspend, child.resume, lambda: clock[0])
+        flow.consume(1000)
+        self.assertTrue(flow.can_send())    # no window is advertised yet
+        flow.grant(100)
+        flow.consume(60)
+        self.assertFalse(child.suspended)
+        flow.consume(60)
+        self.assertTrue(child.suspended)
+        self.assertEqual(flow.credit, -20)
+        clock[0] = 2.5
+        self.assertEqual(flow.total_suspended_time(), 2.5)
+        flow.grant(10)
+        self.assertTrue(child.suspended)
+        clock[0] = 3.0
+        flow.grant(50)
+        self.assertFalse(child.suspended)
+        self.assertEqual((flow.suspend_count, flow.suspended_time), (1, 3.0))
+        flow.consume(100)
+        flow.close()
+        self.assertFalse(child.suspended)
+        flow.grant(10)
+        self.assertIsNone(flow.credit)
+
+    def test_slow_host(self):
+        " a fast child and a slow host: no output is lost, the unread data is bounded "
+        window = 1024
+        clock = [0]
+        child = FakeChild()
+        flow = FlowControl(child.suspend, child.resume, lambda: clock[0])
+        to_host = FrameDecoder()
+        to_console = FrameDecoder()
+        to_console.feed(pack_frame(FRAME_ACK, ACK_PAYLOAD.pack(window)))
+        received = bytearray()
+        unacknowledged = 0
+        suspended_ticks = 0
+        for clock[0] in range(2000):
+            child.tick()
+            suspended_ticks += child.suspended
+            # the console reader
+            while True:
+                frame = to_console.next_frame()
+                if frame is None:
+                    break
+                self.assertEqual(frame[0], FRAME_ACK)
+                flow.grant(ACK_PAYLOAD.unpack(frame[1])[0])
+            if flow.can_send() and child.console:
+                data = b''.join(child.console)
+                child.console.clear()
+                to_host.feed(pack_frame(FRAME_DATA, data))
+                flow.consume(len(data))
+            # the window is exceeded by the last console read at most
+            self.assertGreater(flow.credit, -len(b'line 9999\r\n'))
+            # the host reads in every 200th tick only
+            if clock[0] % 200 == 0:
+                data = read_all(to_host)
+                received += data
+                unacknowledged += len(data)
+                if unacknowledged >= window // 2:
+                    to_console.feed(pack_frame(FRAME_ACK, ACK_PAYLOAD.pack(unacknowledged)))
+                    unacknowledged = 0
+        received += read_all(to_host)
+        received += b''.join(child.console)
+        self.assertEqual(received, b''.join(b'line %d\r\n' % i for i in range(child.lines)))
+        self.assertGreater(flow.suspend_count, 5)
+        self.assertEqual(flow.total_suspended_time(), suspended_ticks)
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+suite = unittest.TestSuite((unittest.makeSuite(FrameTestCase, 'test'),
+                           unittest.makeSuite(FlowControlTestCase, 'test')))
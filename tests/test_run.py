@@ -109,6 +109,11 @@ class RunFuncTestCase(PexpectTestCase.PexpectTestCase):
     #         timeout=10)
     #     assert exitstatus == 0
 
+    def test_run_result_file(self):
+        the_string = self.runfunc('uname -m -n')
+        with self.runfunc('uname -m -n', result_file=True, spillsize=0) as the_file:
+            self.assertEqual(the_file.read(), the_string)
+
     def test_run_event_typeerror(self):
         events = {'>': -1}
         with self.assertRaises(TypeError):
@@ -0,0 +1,368 @@
+import random
+import unittest
+
+from wexpect.console_reader import ConsoleReaderBase
+from wexpect.console_reader import screenbufferfillchar
+from wexpect.screen import Coord
+from wexpect.screen import ScreenModel
+from wexpect.screen import ScriptedChild
+from wexpect.screen import SimulatedScreen
+from tests import PexpectTestCase
+
+
+class SimulatedConsoleReader(ConsoleReaderBase):
+    " a console reader, which scrapes a simulated console, without the child and the host "
+
+    def __init__(self, screen, buffer_size_x=80, buffer_size_y=16000, scroll_through=False):
+        self.scroll_through = scroll_through
+        self.initConsole(screen, buffer_size_x=buffer_size_x, buffer_size_y=buffer_size_y)
+
+    def suspend_child(self):
+        pass
+
+    def resume_child(self):
+        pass
+
+
+def parse_data_reference(s, width, offset):
+    " the character by character parseData() of earlier versions: s starts at offset "
+    strlist = []
+    for i, c in enumerate(s):
+        if c == screenbufferfillchar:
+            if (offset + i + 1) % width == 0:
+                strlist.append('\r\n')
+        else:
+            strlist.append(c)
+    return ''.join(strlist)
+
+
+def read_tick(reader, screen, maxconsoleY):
+    " reads the console like a tick of the read_loop(), which clears or scrolls it at maxconsoleY "
+    if screen.get_cursor_position().Y <= maxconsoleY:
+        return reader.readConsoleToCursor()
+    s = reader.readConsoleToCursor()
+    if reader.scroll_through:
+        reader.scrollConsole()
+    else:
+        reader.refresh_console()
+    return s
+
+
+def scrape_ticks(reader, screen, chunks, maxconsoleY=16000):
+    " writes the chunks into the screen one tick after the other, returns the scraped output "
+    scraped = []
+    for chunk in chunks:
+        screen.put(chunk)
+        scraped.append(read_tick(reader, screen, maxconsoleY))
+    scraped.append(reader.readConsoleToCursor())
+    return ''.join(scraped)
+
+
+def render(s):
+    " the lines of s, as a terminal shows them: a carriage return starts overwriting the line "
+    lines = []
+    for line in s.split('\r\n'):
+        row = ''
+        for part in line.split('\r'):
+            row = part + row[len(part):]
+        lines.append(row)
+    return '\r\n'.join(lines)
+
+
+# The scripts of benchmarks/bench_scrape.py: the output lines by their index.
+SCRIPTS = {
+    'short lines': lambda i: 'C:\\Windows\\System32\\drivers\\etc\\hosts %d\r\n' % i,
+    'wrapped lines': lambda i: ('%d ' % i) * 60 + '\r\n',
+    'progress': lambda i: '\rDownloading... %3d%% [%-40s]' % (i % 100, '#' * (i % 40)) + (
+        '\r\n' if i % 100 == 99 else ''),
+    'dots': lambda i: '.' * 50 + ('\r\n' if i % 40 == 39 else ''),
+    'long lines': lambda i: '.' * 100 + ('\r\n' if i % 200 == 199 else ''),
+}
+
+
+def record_screens(width=80, height=200):
+    " records the screens of scripted children, as the console reader sees them "
+    outputs = [
+        ''.join('line %d\r\n' % i for i in range(150)),
+        ''.join(('%d ' % i) * 40 + '\r\n' for i in range(100)),
+        ''.join('\r%3d%% [%-40s]' % (i, '#' * (i % 40)) for i in range(100)) + '\r\n',
+        '.' * 5000 + '\r\n' + 'x\ty\tz\r\n' * 10 + 'prompt> ',
+        '',
+    ]
+    screens = []
+    for output in outputs:
+        screen = SimulatedScreen(width, height)
+        screen.fill_characters(screenbufferfillchar, width * height, Coord(0, 0))
+        screen.put(output)
+        # the cursor jumps leave fill characters in the middle of the rows
+        for y in range(0, height, 7):
+            screen.set_cursor_position(Coord(y % width, y))
+            screen.put('jump')
+        screens.append(screen.read_characters(width * height, Coord(0, 0)))
+    return screens
+
+
+class SimulatedScreenTestCase(PexpectTestCase.PexpectTestCase):
+
+    def test_put(self):
+        " the control characters move the cursor, the long lines are wrapped "
+        screen = SimulatedScreen(10, 4, fillchar='.')
+        screen.put('abc\r\nde\bf\r1\n\tx')
+        self.assertEqual(screen.read_characters(40, Coord(0, 0)),
+                         'abc.......1f........        x...........')
+        self.assertEqual(screen.get_cursor_position(), Coord(9, 2))
+        screen.put('0123456789')
+        self.assertEqual(screen.read_characters(20, Coord(0, 2)), '        x0123456789.')
+        self.assertEqual(screen.get_cursor_position(), Coord(9, 3))
+
+    def test_write_characters(self):
+        " the characters are written in place, the cursor is not moved "
+        screen = SimulatedScreen(4, 3, fillchar='.')
+        screen.put('ab')
+        self.assertEqual(screen.write_characters('xyzuv', Coord(2, 1)), 5)
+        self.assertEqual(screen.read_characters(12, Coord(0, 0)), 'ab....xyzuv.')
+        self.assertEqual(screen.get_cursor_position(), Coord(2, 0))
+        self.assertEqual(screen.write_characters('123', Coord(2, 2)), 2)
+
+    def test_scroll(self):
+        " the buffer is scrolled, when the cursor leaves the last row "
+        screen = SimulatedScreen(4, 3, fillchar='.')
+        screen.put('a\r\nb\r\nc\r\nd')
+        self.assertEqual(screen.read_characters(12, Coord(0, 0)), 'b...c...d...')
+        self.assertEqual(screen.get_cursor_position(), Coord(1, 2))
+        screen.scroll(2, '*')
+        self.assertEqual(screen.read_characters(12, Coord(0, 0)), 'd...********')
+
+    def test_scripted_child(self):
+        " the output is written at the given rate, the input is echoed "
+        clock = [0.0]
+        screen = SimulatedScreen(20, 4)
+        child = ScriptedChild(screen, 'abcdefghij', rate=100, clock=lambda: clock[0])
+        clock[0] = 0.035
+        self.assertEqual(child.step(), 3)
+        screen.write_input('xy')
+        self.assertEqual(screen.pending_input(), 2)
+        clock[0] = 1
+        self.assertEqual(child.step(), 7)
+        self.assertTrue(child.done())
+        self.assertEqual(screen.pending_input(), 0)
+        self.assertEqual(screen.read_characters(12, Coord(0, 0)), 'abcxydefghij')
+
+    def test_scrape(self):
+        " the console reader scrapes the lines of the child "
+        clock = [0.0]
+        screen = SimulatedScreen()
+        reader = SimulatedConsoleReader(screen, buffer_size_y=200)
+        output = ''.join('line %d\r\n' % i for i in range(100)) + 'prompt> '
+        child = ScriptedChild(screen, output, rate=1000, clock=lambda: clock[0])
+        scraped = []
+        while not child.done():
+            clock[0] += 0.02
+            child.step()
+            scraped.append(reader.readConsoleToCursor())
+        self.assertEqual(''.join(scraped), output)
+        self.assertEqual(reader.readConsoleToCursor(), '')
+
+    def test_unchanged_rows(self):
+        " an area, whose rows have not changed, is not parsed again "
+        screen = SimulatedScreen()
+        reader = SimulatedConsoleReader(screen)
+        parsed = []
+        parseData = reader.parseData
+
+        def counting_parse(s):
+            parsed.append(s)
+            return parseData(s)
+
+        reader.parseData = counting_parse
+        screen.put('.' * 300)
+        self.assertEqual(reader.readConsoleToCursor(), '.' * 300)
+        parsed.clear()
+        self.assertEqual(reader.readConsoleToCursor(), '')
+        self.assertEqual(parsed, [])
+        screen.put('\r\n')
+        self.assertEqual(reader.readConsoleToCursor(), '\r\n')
+        screen.put('\r\n50%\r75%')
+        self.assertEqual(reader.readConsoleToCursor(), '\r\n75%')
+        self.assertEqual(reader.readConsoleToCursor(), '')
+        screen.put('\r99%')
+        self.assertEqual(reader.readConsoleToCursor(), '\r99%')
+
+    def test_cursor_up(self):
+        " the rows above the cursor are rewritten, after the cursor has been moved up "
+        screen = SimulatedScreen(20, 10)
+        reader = SimulatedConsoleReader(screen, 20, 10)
+        screen.put('downloading: ' + '.' * 20)
+        self.assertEqual(reader.readConsoleToCursor(), 'downloading: ' + '.' * 20)
+        screen.set_cursor_position(Coord(0, 0))
+        screen.put('DONE')
+        screen.set_cursor_position(Coord(13, 1))
+        screen.put('!')
+        self.assertEqual(reader.readConsoleToCursor(), '\rDONEloading: ' + '.' * 20 + '!')
+        self.assertEqual(reader.readConsoleToCursor(), '')
+
+    def test_parse_data(self):
+        " parseData() gives the same result as the character by character implementation "
+        rnd = random.Random(0)
+        screen = SimulatedScreen()
+        reader = SimulatedConsoleReader(screen, buffer_size_y=200)
+        for s in record_screens():
+            for _ in range(200):
+                start = rnd.randrange(len(s))
+                area = s[start:start + rnd.choice([1, 79, 80, 81, 1000, len(s)])]
+                reader.lastRead = rnd.randrange(len(area) + 1)
+                reader.totalRead = start + reader.lastRead
+                self.assertEqual(reader.parseData(area), parse_data_reference(area, 80, start))
+            reader.totalRead = reader.lastRead = len(s)
+            self.assertEqual(reader.parseData(s), parse_data_reference(s, 80, 0))
+
+    def test_refresh(self):
+        " the output is not lost, when the console is cleared "
+        screen = SimulatedScreen()
+        reader = SimulatedConsoleReader(screen, buffer_size_y=50)
+        scraped = []
+        for i in range(100):
+            screen.put('line %d\r\n' % i)
+            scraped.append(reader.readConsoleToCursor())
+            if screen.get_cursor_position().Y > 40:
+                reader.refresh_console()
+        self.assertEqual(''.join(scraped), ''.join('line %d\r\n' % i for i in range(100)))
+
+
+    def test_refresh_keeps_cursor_row(self):
+        " the text after the cursor in its row is not lost, when the console is cleared "
+        screen = SimulatedScreen(20, 10)
+        reader = SimulatedConsoleReader(screen, 20, 10)
+        self.assertEqual(scrape_ticks(reader, screen, ['a\r\nb\r\nhello\r']), 'a\r\nb\r\n')
+        reader.refresh_console()
+        self.assertEqual(screen.read_characters(8, Coord(0, 0)), 'hello' + '\4' * 3)
+        self.assertEqual(screen.get_cursor_position(), Coord(0, 0))
+        self.assertEqual(scrape_ticks(reader, screen, ['\n']), 'hello\r\n')
+
+    def test_scroll_console(self):
+        " the read rows are scrolled out, the rest of the content and the cursor move up "
+        screen = SimulatedScreen(20, 10)
+        reader = SimulatedConsoleReader(screen, 20, 10, scroll_through=True)
+        self.assertEqual(scrape_ticks(reader, screen, ['a\r\nb\r\nprompt> ']),
+                         'a\r\nb\r\nprompt> ')
+        self.assertEqual(reader.scrollConsole(), 2)
+        self.assertEqual(screen.read_characters(20, Coord(0, 0)), 'prompt> ' + '\4' * 12)
+        self.assertEqual(screen.read_characters(20, Coord(0, 9)), '\4' * 20)
+        self.assertEqual(screen.get_cursor_position(), Coord(8, 0))
+        self.assertEqual(reader.scrolledRows, 2)
+        self.assertEqual(scrape_ticks(reader, screen, ['ls\r\n']), 'ls\r\n')
+
+    def test_scroll_through(self):
+        " the console reader scrolls the console, instead of clearing it "
+        clock = [0.0]
+        screen = SimulatedScreen(20, 30)
+        reader = SimulatedConsoleReader(screen, 20, 30, scroll_through=True)
+        output = ''.join('line %d\r\n' % i for i in range(500)) + 'prompt> '
+        child = ScriptedChild(screen, output, rate=1000, clock=lambda: clock[0])
+        scraped = []
+        while not child.done():
+            clock[0] += 0.02
+            child.step()
+            scraped.append(read_tick(reader, screen, 15))
+        self.assertEqual(''.join(scraped), output)
+        self.assertEqual(reader.readConsoleToCursor(), '')
+        self.assertGreater(reader.scrolledRows, 400)
+
+    def test_scroll_through_bursts(self):
+        " wrapped lines, progress bars and idle ticks are scraped like without scrolling "
+        rnd = random.Random(0)
+        chunks = []
+        for i in range(300):
+            kind = rnd.randrange(4)
+            if kind == 0:
+                chunks.append(''.join('line %d\r\n' % j for j in range(rnd.randrange(1, 20))))
+            elif kind == 1:
+                chunks.append(('%d_' % i) * rnd.randrange(1, 60) + '\r\n')
+            elif kind == 2:
+                chunks.append('\r%3d%% [%-10s]' % (i % 100, '#' * (i % 10)))
+            else:
+                chunks.append('')
+        screen = SimulatedScreen(20, 3000)
+        expected = scrape_ticks(SimulatedConsoleReader(screen, 20, 3000), screen, chunks)
+        for scroll_through in (False, True):
+            screen = SimulatedScreen(20, 60)
+            reader = SimulatedConsoleReader(screen, 20, 60, scroll_through=scroll_through)
+            self.assertEqual(scrape_ticks(reader, screen, chunks, 30), expected)
+        self.assertGreater(reader.scrolledRows, 1000)
+
+    def test_scrape_scripts(self):
+        " the scraped text shows the output of the scripts in both modes "
+        for name, script in SCRIPTS.items():
+            output = ''.join(script(i) for i in range(150000 // len(script(0)) + 1))
+            for scroll_through in (False, True):
+                clock = [0.0]
+                screen = SimulatedScreen(80, 40)
+                reader = SimulatedConsoleReader(screen, 80, 40, scroll_through=scroll_through)
+                child = ScriptedChild(screen, output, rate=50000, clock=lambda: clock[0])
+                scraped = []
+                while not child.done():
+                    clock[0] += 0.02
+                    child.step()
+                    scraped.append(read_tick(reader, screen, 20))
+                scraped.append(reader.readConsoleToCursor())
+                scraped = ''.join(scraped)
+                if name == 'progress':
+                    # the bar is redrawn many times in a tick, the scraper sees the last one
+                    self.assertEqual(render(scraped), render(output), name)
+                else:
+                    self.assertEqual(scraped, output, (name, scroll_through))
+
+
+class ScreenModelTestCase(PexpectTestCase.PexpectTestCase):
+
+    def test_write(self):
+        " the rows are updated in place, the content after the written text is truncated "
+        model = ScreenModel(4, 5)
+        model.write(0, 'abcdefghij')
+        self.assertEqual(model.rows[:4], ['abcd', 'efgh', 'ij', ''])
+        model.write(6, 'XYZ')
+        self.assertEqual(model.rows[:4], ['abcd', 'efXY', 'Z', ''])
+        self.assertEqual((model.start, model.end), (0, 9))
+        self.assertEqual(model.read(3, 100), 'defXYZ')
+        self.assertEqual(model.read(4, 8), 'efXY')
+        self.assertEqual(model.char(7), 'Y')
+        model.write(2, '')
+        self.assertEqual(model.rows[:3], ['ab', '', ''])
+        # the gap is padded like in a StringIO
+        model.write(5, 'k')
+        self.assertEqual(model.read(0, 100), 'ab\0\0\0k')
+
+    def test_trim(self):
+        " the content before the start is forgotten "
+        model = ScreenModel(4, 5)
+        model.write(0, 'abcdefghij')
+        model.trim(5)
+        self.assertEqual(model.rows[:3], ['', 'efgh', 'ij'])
+        self.assertEqual(model.read(0, 100), 'fghij')
+        model.write(2, 'xy')
+        self.assertEqual((model.start, model.end), (2, 4))
+        self.assertEqual(model.read(0, 100), 'xy')
+        model.trim(20)
+        self.assertEqual(model.read(0, 100), '')
+        self.assertEqual(model.rows, [''] * 5)
+
+    def test_scroll(self):
+        " the content moves up with the screen buffer "
+        model = ScreenModel(4, 5)
+        model.write(2, 'abcdefghij')
+        model.scroll(1)
+        self.assertEqual(model.rows, ['cdef', 'ghij', '', '', ''])
+        self.assertEqual((model.start, model.end), (0, 8))
+        model.trim(4)
+        model.scroll(1)
+        self.assertEqual(model.read(0, 100), 'ghij')
+        model.scroll(2)
+        self.assertEqual(model.read(0, 100), '')
+        self.assertEqual(model.rows, [''] * 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+suite = unittest.TestSuite((unittest.makeSuite(SimulatedScreenTestCase, 'test'),
+                           unittest.makeSuite(ScreenModelTestCase, 'test')))
@@ -0,0 +1,335 @@
+import re
+import unittest
+
+import wexpect
+from wexpect.wexpect_util import pattern_max_span
+from wexpect.wexpect_util import pattern_required_literal
+from wexpect.wexpect_util import pattern_tail_width
+from wexpect.wexpect_util import pattern_bytes_safe
+from wexpect.host import SpawnBuffer
+from wexpect.host import SpillBuffer
+from wexpect.host import SpillFile
+from wexpect.host import BytesBuffer
+from tests import PexpectTestCase
+
+
+class SearcherStringTestCase(PexpectTestCase.PexpectTestCase):
+
+    def test_leftmost_match(self):
+        " the leftmost match wins, even if an other string is found earlier by the scan "
+        searcher = wexpect.searcher_string(['bc', 'abcd'])
+        self.assertEqual(searcher.search('xxabcd', 6), 1)
+        self.assertEqual((searcher.start, searcher.end, searcher.match), (2, 6, 'abcd'))
+
+    def test_same_start_lowest_index(self):
+        " if more strings match at the same position, the first in the list wins "
+        searcher = wexpect.searcher_string(['foobar', 'foo', 'bar'])
+        self.assertEqual(searcher.search('xfoobar', 7), 0)
+        searcher = wexpect.searcher_string(['bar', 'foo', 'foobar'])
+        self.assertEqual(searcher.search('xfoobar', 7), 1)
+
+    def test_resume_on_fresh_data(self):
+        " a string split between two reads is found when the scan is resumed "
+        searcher = wexpect.searcher_string(['prompt> ', wexpect.EOF])
+        buffer = 'some output\r\npro'
+        self.assertEqual(searcher.search(buffer, len(buffer)), -1)
+        buffer += 'mpt> '
+        self.assertEqual(searcher.search(buffer, 5), 0)
+        self.assertEqual((searcher.start, searcher.end), (13, 21))
+        self.assertEqual(searcher.eof_index, 1)
+
+    def test_searchwindowsize(self):
+        " matches starting before the search window are ignored "
+        searcher = wexpect.searcher_string(['abc'])
+        self.assertEqual(searcher.search('abcxxxx', 7, 4), -1)
+        self.assertEqual(searcher.search('abcxxxxab', 2, 4), -1)
+        self.assertEqual(searcher.search('abcxxxxabc', 1, 4), 0)
+        self.assertEqual(searcher.start, 7)
+
+    def test_many_strings(self):
+        " compare the automaton to the plain str.find() search "
+        strings = ['prompt_%d> ' % i for i in range(200)]
+        searcher = wexpect.searcher_string(strings)
+        buffer = 'prompt_1 prompt_19> prompt_199> '
+        self.assertEqual(searcher.search(buffer, len(buffer)), 19)
+        self.assertEqual(searcher.start, buffer.find('prompt_19> '))
+
+    def test_pos(self):
+        " the data before 'pos' is not searched "
+        searcher = wexpect.searcher_string(['abc'])
+        self.assertEqual(searcher.search('abcxabc', 6, None, 1), 0)
+        self.assertEqual(searcher.start, 4)
+        # the empty string matches at the start of the buffer
+        searcher = wexpect.searcher_string(['x', ''])
+        self.assertEqual(searcher.search('abcd', 0, None, 2), 1)
+        self.assertEqual(searcher.start, 2)
+
+
+class SearcherReTestCase(PexpectTestCase.PexpectTestCase):
+
+    def test_pattern_max_span(self):
+        self.assertEqual(pattern_max_span(re.compile('abc')), 3)
+        self.assertEqual(pattern_max_span(re.compile(r'\d{2,5}x')), 6)
+        # '$' may inspect the character after the match
+        self.assertEqual(pattern_max_span(re.compile('> $')), 4)
+        # the lookahead inspects characters after the match
+        self.assertEqual(pattern_max_span(re.compile('a(?=bc)')), 5)
+        self.assertIsNone(pattern_max_span(re.compile('a.*b')))
+        self.assertIsNone(pattern_max_span(re.compile(r'(a)\1')))
+
+    def test_resume_bounded(self):
+        " a bounded pattern split between two reads is found "
+        searcher = wexpect.searcher_re([re.compile(r'\[\d\d%\] done')])
+        buffer = 'x' * 1000 + '[4'
+        self.assertEqual(searcher.search(buffer, len(buffer)), -1)
+        buffer += '2%] done'
+        self.assertEqual(searcher.search(buffer, 8), 0)
+        self.assertEqual((searcher.start, searcher.end), (1000, 1010))
+
+    def test_resume_lookahead(self):
+        " a lookahead, which has failed at the end of the old buffer, can match later "
+        searcher = wexpect.searcher_re([re.compile('a(?=bc)')])
+        self.assertEqual(searcher.search('xxa', 3), -1)
+        self.assertEqual(searcher.search('xxab', 1), -1)
+        self.assertEqual(searcher.search('xxabc', 1), 0)
+        self.assertEqual(searcher.start, 2)
+
+    def test_unbounded_leftmost(self):
+        " an unbounded pattern still finds the leftmost match "
+        searcher = wexpect.searcher_re([re.compile('b'), re.compile('a.*c', re.DOTALL)])
+        self.assertEqual(searcher.search('xa' + 'x' * 100, 102), -1)
+        self.assertEqual(searcher.search('xa' + 'x' * 100 + 'bc', 2), 1)
+        self.assertEqual((searcher.start, searcher.end), (1, 104))
+
+    def test_fused_order(self):
+        " the fused search keeps the leftmost match, then the list order "
+        patterns = [re.compile(p, re.DOTALL) for p in ['foobar', 'foo', 'fo+bar', 'bar']]
+        for fuse in (True, False):
+            searcher = wexpect.searcher_re(patterns, fuse=fuse)
+            self.assertEqual(searcher.search('xbar foobar', 11), 3)
+            self.assertEqual(searcher.start, 1)
+            searcher = wexpect.searcher_re(patterns[1:], fuse=fuse)
+            self.assertEqual(searcher.search('xfoobar', 7), 0)
+            self.assertEqual(searcher.match.group(), 'foo')
+
+    def test_fused_match_groups(self):
+        " the match object comes from the original pattern, so the group numbers are kept "
+        patterns = [re.compile(r'\[(\d+)%\] done'), re.compile(r'\[(\w+)\] failed')]
+        searcher = wexpect.searcher_re(patterns)
+        self.assertEqual(len(searcher._units), 1)
+        self.assertEqual(searcher.search('[compile] failed', 16), 1)
+        self.assertEqual(searcher.match.group(1), 'compile')
+
+    def test_fuse_fallback(self):
+        " patterns with backreferences, other flags or other first characters are not fused "
+        patterns = [re.compile(r'(a)\1'), re.compile('ab'), re.compile('ac', re.IGNORECASE)]
+        searcher = wexpect.searcher_re(patterns, fuse=True)
+        self.assertEqual(len(searcher._units), 3)
+        self.assertEqual(searcher.search('xAcab', 5), 2)
+        searcher = wexpect.searcher_re([re.compile('ab'), re.compile('ba'), re.compile('ac')])
+        self.assertEqual(sorted(positions for positions, _ in searcher._units), [[0, 2], [1]])
+
+    def test_pattern_required_literal(self):
+        self.assertEqual(pattern_required_literal(re.compile(r'Password:\s*$')), ('Password:', 0))
+        self.assertEqual(pattern_required_literal(re.compile(r'\[(\d+)%\] done')),
+                         ('%] done', None))
+        self.assertEqual(pattern_required_literal(re.compile(r'\d{1,3}ab(x|y)cde')), ('cde', 6))
+        self.assertIsNone(pattern_required_literal(re.compile('abc|def')))
+        self.assertIsNone(pattern_required_literal(re.compile('abc', re.IGNORECASE)))
+
+    def test_prefilter(self):
+        " the prefilter does not change the result "
+        patterns = [re.compile(r'(\d+) files? copied'), re.compile(r'\s+ERROR:\s+(.*)$', re.DOTALL)]
+        buffer = '1 2 3 ' * 1000
+        for prefilter in (True, False):
+            searcher = wexpect.searcher_re(patterns, prefilter=prefilter)
+            self.assertEqual(searcher.search(buffer, len(buffer)), -1)
+            self.assertEqual(searcher.search(buffer + '4 file', 6), -1)
+            self.assertEqual(searcher.search(buffer + '4 files copied  ERROR: x', 18), 0)
+            self.assertEqual(searcher.match.group(1), '4')
+
+    def test_pattern_tail_width(self):
+        self.assertEqual(pattern_tail_width(re.compile('> $')), 3)
+        self.assertEqual(pattern_tail_width(re.compile(r'(C:\\|D:\\)>\Z')), 5)
+        self.assertIsNone(pattern_tail_width(re.compile('> $', re.MULTILINE)))
+        self.assertIsNone(pattern_tail_width(re.compile(r'\w+> $')))
+        self.assertIsNone(pattern_tail_width(re.compile('> ')))
+
+    def test_max_span(self):
+        " the tail of the buffer, where an undecided match may start, is bounded by the span "
+        self.assertEqual(wexpect.searcher_re([re.compile('abc'), re.compile('x$')]).max_span(), 3)
+        self.assertIsNone(wexpect.searcher_re([re.compile('abc'), re.compile('x+')]).max_span())
+        self.assertEqual(wexpect.searcher_string(['abc', 'de', wexpect.EOF]).max_span(), 3)
+
+    def test_pattern_bytes_safe(self):
+        self.assertTrue(pattern_bytes_safe(re.compile(r'ERROR \d+: [a-z]+\s*$', re.ASCII)))
+        self.assertTrue(pattern_bytes_safe(re.compile(r'ERROR [0-9]+: [a-z]+[ \t]*$')))
+        # the str '\s' and '\d' match more than the bytes ones, e.g. '\x1c'
+        self.assertFalse(pattern_bytes_safe(re.compile(r'\s')))
+        self.assertFalse(pattern_bytes_safe(re.compile(r'\d')))
+        self.assertFalse(pattern_bytes_safe(re.compile('a(?=b)')))
+        self.assertFalse(pattern_bytes_safe(re.compile('a.b')))
+        self.assertFalse(pattern_bytes_safe(re.compile(r'\w+')))
+        self.assertFalse(pattern_bytes_safe(re.compile('[^>]*> ')))
+        self.assertFalse(pattern_bytes_safe(re.compile('\u00e9+')))
+        self.assertFalse(pattern_bytes_safe(re.compile('abc', re.IGNORECASE)))
+
+    def test_tail_anchored(self):
+        " end anchored patterns match only at the end of the buffer "
+        searcher = wexpect.searcher_re([re.compile('> $'), re.compile(r'\$ $')])
+        buffer = 'a> b$ c> \r\n' * 1000
+        self.assertEqual(searcher.search(buffer, len(buffer)), -1)
+        buffer += 'C:\\> '
+        self.assertEqual(searcher.search(buffer, len(buffer)), 0)
+        self.assertEqual(searcher.start, len(buffer) - 2)
+        # '$' matches before the last newline too
+        self.assertEqual(searcher.search('$ \n', 3), 1)
+
+    def test_pos(self):
+        " the search from 'pos' is the search of the slice, if the patterns do not look behind "
+        searcher = wexpect.searcher_re([re.compile('a+'), re.compile('> $')])
+        self.assertTrue(searcher.pos_safe)
+        self.assertEqual(searcher.search('aaxaa> ', 7, None, 1), 0)
+        self.assertEqual((searcher.start, searcher.end), (1, 2))
+        self.assertFalse(wexpect.searcher_re([re.compile('^a')]).pos_safe)
+        self.assertFalse(wexpect.searcher_re([re.compile(r'\bfoo')]).pos_safe)
+        self.assertFalse(wexpect.searcher_re([re.compile('(?<=a)b')]).pos_safe)
+
+
+class SpawnBufferTestCase(PexpectTestCase.PexpectTestCase):
+
+    def test_spill(self):
+        buffer = SpillBuffer('ab', spillsize=2)
+        self.assertFalse(buffer.spilled)
+        buffer.append('cd\u00e9f\r\n')
+        self.assertTrue(buffer.spilled)
+        # the spilled buffer is measured in bytes of the UTF-8 encoded text
+        self.assertEqual(len(buffer), 9)
+        self.assertEqual(buffer.append('> '), 2)
+        self.assertEqual(str(buffer), 'abcd\u00e9f\r\n> ')
+        searcher = wexpect.searcher_re([re.compile('f'), re.compile(r'(\s+)> $', re.ASCII)])
+        self.assertEqual(buffer.search(searcher, 11, None), 0)
+        self.assertEqual((searcher.start, searcher.end, searcher.match.group()), (6, 7, 'f'))
+        buffer.consume(searcher.end)
+        self.assertEqual(buffer.search(searcher, 4, None), 1)
+        self.assertEqual(searcher.match.group(1), '\r\n')
+        # the buffer is loaded back into the memory, when it is short enough
+        buffer.consume(searcher.end)
+        self.assertFalse(buffer.spilled)
+        self.assertEqual(str(buffer), '')
+
+    def test_spill_compact(self):
+        " a long tail is copied to a new file chunk by chunk, a short one is decoded "
+        buffer = SpillBuffer('', spillsize=4)
+        buffer.append('ab\u00e9cdefgh')
+        buffer.consume(1)
+        buffer.compact()
+        self.assertTrue(buffer.spilled)
+        self.assertEqual((buffer.offset, str(buffer)), (0, 'b\u00e9cdefgh'))
+        spillfile = SpillFile()
+        buffer.data.copy_to(spillfile, 1, chunksize=2)
+        self.assertEqual(spillfile[:], '\u00e9cdefgh')
+        buffer.consume(6)
+        self.assertFalse(buffer.spilled)
+        self.assertEqual(buffer.data, 'fgh')
+
+    def test_spill_decoded_search(self):
+        " patterns, which cannot search the encoded text, search the decoded text "
+        buffer = SpillBuffer('x\u00e9y\u00e9z', spillsize=0)
+        searcher = wexpect.searcher_re([re.compile('.z')])
+        self.assertIsNone(searcher.encoded())
+        self.assertEqual(buffer.search(searcher, len(buffer), None), 0)
+        self.assertEqual((searcher.start, searcher.end), (4, 7))
+        self.assertEqual(buffer.data[searcher.start:searcher.end], '\u00e9z')
+
+    def test_consume(self):
+        buffer = SpawnBuffer('abc')
+        buffer.append('def')
+        buffer.consume(1)
+        self.assertEqual((buffer.data, buffer.offset, len(buffer)), ('abcdef', 1, 5))
+        # the consumed data is released, when it is the bigger part
+        buffer.consume(4)
+        self.assertEqual((buffer.data, buffer.offset, len(buffer)), ('ef', 0, 2))
+        buffer.consume(1)
+        self.assertEqual(str(buffer), 'f')
+        self.assertEqual(buffer.offset, 0)
+
+    def test_relative_match(self):
+        " the match is relative to the unconsumed data, like the match of a str buffer "
+        buffer = SpawnBuffer('one\ntwo\nthree\nfour\n')
+        searcher = wexpect.searcher_re([re.compile(r'\w+\n'), re.compile('(t)hree$')])
+        self.assertEqual(buffer.search(searcher, len(buffer), None), 0)
+        buffer.consume(searcher.end)
+        self.assertEqual(buffer.search(searcher, 0, None), 0)
+        match = buffer.match(searcher)
+        self.assertEqual((searcher.start, match.start(), match.end()), (4, 0, 4))
+        self.assertEqual(match.group(), 'two\n')
+        buffer.consume(searcher.end)
+        searcher = wexpect.searcher_re([re.compile('(t)hree\n(?=four)')])
+        self.assertEqual(buffer.search(searcher, 0, None), 0)
+        match = buffer.match(searcher)
+        self.assertEqual((match.span(), match.span(1)), ((0, 6), (0, 1)))
+
+    def test_bytes(self):
+        " the bytes buffer is extended in place, the searchers search it with bytes patterns "
+        buffer = BytesBuffer(b'abc')
+        data = buffer.data
+        buffer.append(b'\xff\r\n> ')
+        self.assertIs(buffer.data, data)
+        searcher = wexpect.searcher_re([re.compile(rb'\xff\s+'), re.compile(rb'> $')])
+        self.assertEqual(buffer.search(searcher, 5, None), 0)
+        self.assertEqual((searcher.start, searcher.end), (3, 6))
+        buffer.consume(searcher.end)
+        searcher = wexpect.searcher_string([b'> '])
+        self.assertEqual(buffer.search(searcher, 2, None), 0)
+        self.assertEqual(buffer.getvalue(), b'> ')
+
+
+class PatternSetTestCase(PexpectTestCase.PexpectTestCase):
+
+    def test_cache(self):
+        " the same pattern list is compiled only once "
+        patterns = wexpect.compile_patterns(['> $', wexpect.EOF])
+        self.assertIs(wexpect.compile_patterns(['> $', wexpect.EOF]), patterns)
+        self.assertIsNot(wexpect.compile_patterns(['> $', wexpect.EOF], ignorecase=True), patterns)
+        self.assertIs(wexpect.compile_patterns(patterns), patterns)
+        self.assertEqual(patterns.eof_index, 1)
+        self.assertEqual(patterns.timeout_index, -1)
+
+    def test_independent_searchers(self):
+        " the searchers of a PatternSet do not share their search state "
+        patterns = wexpect.compile_patterns(['prompt> '], exact=True)
+        first = patterns.searcher()
+        second = patterns.searcher()
+        self.assertEqual(first.search('xx prom', 7), -1)
+        self.assertEqual(second.search('pt> ', 4), -1)
+        self.assertEqual(first.search('xx prompt> ', 4), 0)
+
+    def test_bad_type(self):
+        with self.assertRaises(TypeError):
+            wexpect.compile_patterns([1])
+        with self.assertRaises(TypeError):
+            wexpect.compile_patterns([['a']])
+        with self.assertRaises(TypeError):
+            wexpect.compile_patterns(['a', b'b'])
+
+    def test_bad_type_logged_once(self):
+        with self.assertLogs('wexpect', 'WARNING') as logs:
+            with self.assertRaises(TypeError):
+                wexpect.compile_patterns([1])
+        self.assertEqual(len(logs.records), 1)
+
+    def test_string_type(self):
+        self.assertIs(wexpect.compile_patterns(['a', wexpect.EOF]).string_type, str)
+        self.assertIs(wexpect.compile_patterns([re.compile(b'a')]).string_type, bytes)
+        self.assertIs(wexpect.compile_patterns(b'a', exact=True).string_type, bytes)
+        self.assertIsNone(wexpect.compile_patterns(wexpect.EOF).string_type)
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+suite = unittest.TestSuite((unittest.makeSuite(SearcherStringTestCase, 'test'),
+                           unittest.makeSuite(SearcherReTestCase, 'test'),
+                           unittest.makeSuite(SpawnBufferTestCase, 'test'),
+                           unittest.makeSuite(PatternSetTestCase, 'test')))
@@ -88,6 +88,21 @@ class Exp_TimeoutTestCase(PexpectTestCase.PexpectTestCase):
         if wexpect.spawn_class_name == 'SpawnSocket':
             p.terminate()
 
+    def test_timeout_deadline (self):
+        '''Verify that expect() waits for the data until the deadline, neither shorter nor much
+        longer.'''
+        p = wexpect.spawn('cat')
+        start = time.monotonic()
+        index = p.expect(['Goodbye', wexpect.TIMEOUT], timeout=1)
+        elapsed = time.monotonic() - start
+        self.assertEqual(index, 1)
+        self.assertGreaterEqual(elapsed, 1)
+        self.assertLess(elapsed, 1.5)
+
+        # Termination of the SpawnSocket is slow. We have to wait to prevent the failure of the next test.
+        if wexpect.spawn_class_name == 'SpawnSocket':
+            p.terminate()
+
 if __name__ == '__main__':
     unittest.main()
 
@@ -32,6 +32,7 @@ else:
     from .wexpect_util import ExceptionPexpect
     from .wexpect_util import EOF
     from .wexpect_util import TIMEOUT
+    from .wexpect_util import BufferOverflow
 
     from .console_reader import ConsoleReaderSocket
     from .console_reader import ConsoleReaderPipe
@@ -41,6 +42,8 @@ else:
     from .host import run
     from .host import searcher_string
     from .host import searcher_re
+    from .host import PatternSet
+    from .host import compile_patterns
 
     try:
         spawn = globals()[spawn_class_name]
@@ -55,4 +58,6 @@ else:
         __version__ = '0.0.1.unkowndev0'
 
     __all__ = ['ExceptionPexpect', 'EOF', 'TIMEOUT', 'ConsoleReaderSocket', 'ConsoleReaderPipe',
-               'spawn', 'SpawnSocket', 'SpawnPipe', 'run', '__version__', 'spawn_class_name']
+               'spawn', 'SpawnSocket', 'SpawnPipe', 'run',
+               '__version__', 'spawn_class_name', 'PatternSet', 'compile_patterns',
+               'BufferOverflow']
@@ -27,9 +27,18 @@ def main():
                             default=16000)
         parser.add_argument('--local_echo', type=str, help='Echo sent characters', default=True)
         parser.add_argument('--interact', type=str, help='Show console window', default=False)
+        parser.add_argument('--scroll_through', type=str, help=
+                            'Scroll the read rows out of the console, instead of clearing it, when it is full',
+                            default=False)
         parser.add_argument('--port', type=int, help=
                             "If the console reader class is SpawnSocket, this option specifies the "
                             "socket's port.", default=False)
+        parser.add_argument('--host', type=str, help=
+                            "If the console reader class is SpawnSocket, this option specifies the "
+                            "host's address, where the console reader connects to.", default=None)
+        parser.add_argument('--pipe_name', type=str, help=
+                            "If the console reader class is SpawnPipe, this option specifies the "
+                            "name of the pipe created by the host.", default=None)
 
         try:
             args = parser.parse_args()
@@ -49,9 +58,11 @@ def main():
 
         cons = conole_reader_class(
             path=command, host_pid=args.host_pid, codepage=args.codepage, port=args.port,
+            host=args.host, pipe_name=args.pipe_name,
             window_size_x=args.window_size_x, window_size_y=args.window_size_y,
             buffer_size_x=args.buffer_size_x, buffer_size_y=args.buffer_size_y,
-            local_echo=wexpect_util.str2bool(args.local_echo), interact=wexpect_util.str2bool(args.interact))
+            local_echo=wexpect_util.str2bool(args.local_echo), interact=wexpect_util.str2bool(args.interact),
+            scroll_through=wexpect_util.str2bool(args.scroll_through))
 
         logger.info(f'Exiting with status: {cons.child_exitstatus}')
         sys.exit(cons.child_exitstatus)
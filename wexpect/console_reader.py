@@ -7,27 +7,48 @@ console_reader Implements a virtual terminal, and starts the child program.
 The main wexpect.spawn class connect to this class to reach the child's terminal.
 """
 
+import sys
 import time
 import logging
 import os
 import traceback
 import psutil
-from io import StringIO
 
 import ctypes
-from ctypes import windll
-import win32console
-import win32process
-import win32con
-import win32file
-import win32gui
-import win32pipe
 import socket
 
+if sys.platform == 'win32':
+    # The console reader works only on Windows, but the module can be imported anywhere, so the
+    # platform independent parts of the package can be tested.
+    from ctypes import windll
+    import win32console
+    import win32process
+    import win32con
+    import win32file
+    import win32gui
+    import win32pipe
+
 from .wexpect_util import init_logger
-from .wexpect_util import EOF_CHAR
-from .wexpect_util import SIGNAL_CHARS
 from .wexpect_util import TIMEOUT
+from .wexpect_util import ProtocolError
+from .wexpect_util import FrameDecoder
+from .wexpect_util import FRAME_HELLO
+from .wexpect_util import FRAME_DATA
+from .wexpect_util import FRAME_EOF
+from .wexpect_util import FRAME_SIGNAL
+from .wexpect_util import FRAME_EXIT_STATUS
+from .wexpect_util import FRAME_ACK
+from .wexpect_util import SIGNAL_PAYLOAD
+from .wexpect_util import ACK_PAYLOAD
+from .wexpect_util import EXIT_STATUS_PAYLOAD
+from .wexpect_util import PROTOCOL_VERSIONS
+from .wexpect_util import pack_frame
+from .wexpect_util import pack_hello
+from .wexpect_util import unpack_hello
+from .wexpect_util import FlowControl
+from .screen import Coord
+from .screen import ScreenModel
+from .screen import Win32Screen
 
 #
 # System-wide constants
@@ -35,6 +56,7 @@ from .wexpect_util import TIMEOUT
 screenbufferfillchar = '\4'
 maxconsoleY = 8000
 default_port = 4321
+default_host = '127.0.0.1'
 
 #
 # Create logger: We write logs only to file. Printing out logs are dangerous, because of the deep
@@ -50,31 +72,36 @@ class ConsoleReaderBase:
     """
 
     def __init__(self, path, host_pid, codepage=None, window_size_x=80, window_size_y=25,
-                 buffer_size_x=80, buffer_size_y=16000, local_echo=True, interact=False, **kwargs):
+                 buffer_size_x=80, buffer_size_y=16000, local_echo=True, interact=False,
+                 scroll_through=False, **kwargs):
         """Initialize the console starts the child in it and reads the console periodically.
 
         Args:
             path (str): Child's executable with arguments.
             parent_pid (int): Parent (aka. host) process process-ID
             codepage (:obj:, optional): Output console code page.
+            scroll_through (bool): Scroll the read rows out of the console at maxconsoleY,
+                instead of clearing it after a fixed pause. See scrollConsole().
         """
-        self.lastRead = 0
-        self.__bufferY = 0
-        self.lastReadData = ""
-        self.totalRead = 0
-        self.__buffer = StringIO()
-        self.__currentReadCo = win32console.PyCOORDType(0, 0)
         self.pipe = None
         self.connection = None
-        self.consin = None
-        self.consout = None
+        self.screen = None                  # The screen buffer backend, see initConsole().
+        self.scroll_through = scroll_through
         self.local_echo = local_echo
         self.console_pid = os.getpid()
         self.host_pid = host_pid
         self.host_process = psutil.Process(host_pid)
         self.child_process = None
         self.child_pid = None
-        self.enable_signal_chars = True
+        self.__childProcess = None
+        # The handle of the main thread of the child, from CreateProcess(). It is opened once, so
+        # suspend_child() and resume_child() do not open (and leak) a handle at each call.
+        self.child_thread = None
+        self.enable_signal_chars = True     # Send the signals of the SIGNAL frames to the child.
+        self.frames = FrameDecoder()        # The frames received from the host.
+        # The send window granted by the host. The child is suspended while it is exhausted.
+        self.flow = FlowControl(self.suspend_child, self.resume_child)
+        self.protocol_version = None
         self.timeout = 30
         self.child_exitstatus = None
 
@@ -94,11 +121,13 @@ class ConsoleReaderBase:
 
         try:
             self.create_connection(**kwargs)
+            self.negotiate_protocol()
             logger.info('Spawning %s' % path)
             try:
                 self.initConsole()
                 si = win32process.GetStartupInfo()
-                self.__childProcess, _, self.child_pid, self.child_tid = win32process.CreateProcess(
+                (self.__childProcess, self.child_thread, self.child_pid,
+                 self.child_tid) = win32process.CreateProcess(
                     None, path, None, None, False, 0, None, None, si)
                 self.child_process = psutil.Process(self.child_pid)
 
@@ -119,10 +148,14 @@ class ConsoleReaderBase:
             logger.error(traceback.format_exc())
         finally:
             try:
+                self.flow.close()
                 self.terminate_child()
                 time.sleep(.01)
-                self.send_to_host(self.readConsoleToCursor())
+                self.send_output(self.readConsoleToCursor())
+                self.send_exit_status()
                 self.sendeof()
+                logger.info(f'Suspended by the flow control {self.flow.suspend_count} times for'
+                            f' {self.flow.total_suspended_time():.3f} s.')
                 time.sleep(.1)
                 self.close_connection()
                 logger.info('Console finished.')
@@ -142,62 +175,115 @@ class ConsoleReaderBase:
                 logger.info(f'Child finished with code: {self.child_exitstatus}')
                 return
 
-            consinfo = self.consout.GetConsoleScreenBufferInfo()
-            cursorPos = consinfo['CursorPosition']
+            cursorPos = self.screen.get_cursor_position()
 
-            if cursorPos.Y > maxconsoleY:
+            if not self.flow.can_send():
+                # The child is suspended, until the host grants more credit.
+                pass
+            elif cursorPos.Y > maxconsoleY:
                 '''If the console output becomes long, we suspend the child, read all output then
-                clear the console before we resume the child.
+                clear the console (or scroll the read rows out of it) before we resume the child.
                 '''
                 logger.info('cursorPos %s' % cursorPos)
                 self.suspend_child()
-                time.sleep(.2)
-                self.send_to_host(self.readConsoleToCursor())
-                self.refresh_console()
+                if self.scroll_through:
+                    self.send_output(self.readConsoleToCursor())
+                    self.scrollConsole()
+                else:
+                    time.sleep(.2)
+                    self.send_output(self.readConsoleToCursor())
+                    self.refresh_console()
                 self.resume_child()
             else:
-                self.send_to_host(self.readConsoleToCursor())
+                self.send_output(self.readConsoleToCursor())
 
             s = self.get_from_host()
             if s:
                 logger.debug(f'get_from_host: {s}')
             else:
                 logger.spam(f'get_from_host: {s}')
-            if self.enable_signal_chars:
-                for sig, char in SIGNAL_CHARS.items():
-                    if char in s:
+            self.frames.feed(s)
+            while True:
+                frame = self.frames.next_frame()
+                if frame is None:
+                    break
+                kind, payload = frame
+                if kind == FRAME_DATA:
+                    self.write(str(payload, 'utf-8'))
+                elif kind == FRAME_SIGNAL:
+                    if self.enable_signal_chars:
+                        sig, = SIGNAL_PAYLOAD.unpack(payload)
                         self.child_process.send_signal(sig)
-            s = s.decode()
-            self.write(s)
+                elif kind == FRAME_ACK:
+                    self.flow.grant(ACK_PAYLOAD.unpack(payload)[0])
+                else:
+                    logger.debug(f'Unexpected frame: {kind} {bytes(payload)}')
 
 
             time.sleep(.02)
 
+    def is_child_running(self):
+        """True, if the child process has been started, and it has not finished yet."""
+        return self.__childProcess is not None and (
+            win32process.GetExitCodeProcess(self.__childProcess) == win32con.STILL_ACTIVE)
+
     def suspend_child(self):
-        """Pauses the main thread of the child process."""
-        handle = windll.kernel32.OpenThread(win32con.THREAD_SUSPEND_RESUME, 0, self.child_tid)
-        win32process.SuspendThread(handle)
+        """Pauses the main thread of the child process. A finished child is not touched."""
+        if self.is_child_running():
+            win32process.SuspendThread(self.child_thread)
 
     def resume_child(self):
-        """Un-pauses the main thread of the child process."""
-        handle = windll.kernel32.OpenThread(win32con.THREAD_SUSPEND_RESUME, 0, self.child_tid)
-        win32process.ResumeThread(handle)
+        """Un-pauses the main thread of the child process. A finished child is not touched."""
+        if self.is_child_running():
+            win32process.ResumeThread(self.child_thread)
 
     def refresh_console(self):
         """Clears the console after pausing the child and
-        reading all the data currently on the console."""
+        reading all the data currently on the console.
+
+        The row of the cursor is kept, it is moved to the top: the child may have written text
+        after the cursor (e.g. before a carriage return), which has not been read yet."""
 
-        orig = win32console.PyCOORDType(0, 0)
-        self.consout.SetConsoleCursorPosition(orig)
-        self.__currentReadCo.X = 0
-        self.__currentReadCo.Y = 0
+        orig = Coord(0, 0)
+        cursorPos = self.screen.get_cursor_position()
+        row = self.screen.read_characters(self.__consSize.X, Coord(0, cursorPos.Y))
         writelen = self.__consSize.X * self.__consSize.Y
         # Use NUL as fill char because it displays as whitespace
         # (if we interact() with the child)
-        self.consout.FillConsoleOutputCharacter(screenbufferfillchar, writelen, orig)
-
-        self.__bufferY = 0
-        self.__buffer.truncate(0)
+        self.screen.fill_characters(screenbufferfillchar, writelen, orig)
+        self.screen.write_characters(row, orig)
+        self.screen.set_cursor_position(Coord(cursorPos.X, 0))
+        self.scrolled(cursorPos.Y)
+
+    def scrollConsole(self):
+        """Scrolls the rows, which have been read, out of the console in scroll-through mode,
+        instead of clearing it: the rows above the last line break (or above the cursor row in
+        a very long line) are dropped, the rest of the content and the cursor are moved to the
+        top, and the bottom rows are filled with screenbufferfillchar. The child has to be
+        suspended, and the console has to be read right before. Returns the number of the
+        scrolled rows."""
+
+        cursorPos = self.screen.get_cursor_position()
+        lines = self.__bufferY or cursorPos.Y
+        if not lines:
+            return 0
+        self.screen.scroll(lines, screenbufferfillchar)
+        self.screen.set_cursor_position(Coord(cursorPos.X, cursorPos.Y - lines))
+        self.scrolled(lines)
+        self.scrolledRows += lines
+        return lines
+
+    def scrolled(self, lines):
+        """Moves the read position and the shadow copy of the screen up with the content of the
+        console, which has been moved up by lines rows. The rows above the cursor row have been
+        read already."""
+
+        self.__bufferY = max(self.__bufferY - lines, 0)
+        self.__currentReadCo.X = self.__currentReadCo.X if self.__currentReadCo.Y >= lines else 0
+        self.__currentReadCo.Y = max(self.__currentReadCo.Y - lines, 0)
+        self.__shadow.scroll(lines)
+        self.__lastRegion = None
+        self.__fingerprints = None
 
     def terminate_child(self):
         try:
@@ -222,28 +308,26 @@ class ConsoleReaderBase:
             return 0
         if s[-1] == '\n':
             s = s[:-1]
-        records = [self.createKeyEvent(c) for c in str(s)]
-        if not self.consout:
+        if not self.screen:
             return ""
 
         # Store the current cursor position to hide characters in local echo disabled mode
         # (workaround).
-        consinfo = self.consout.GetConsoleScreenBufferInfo()
-        startCo = consinfo['CursorPosition']
+        startCo = self.screen.get_cursor_position()
 
         # Send the string to console input
-        wrote = self.consin.WriteConsoleInput(records)
+        wrote = self.screen.write_input(str(s))
 
         # Wait until all input has been recorded by the console.
         ts = time.time()
-        while self.consin.PeekConsoleInput(8) != ():
+        while self.screen.pending_input():
             if time.time() > ts + len(s) * .1 + .5:
                 break
             time.sleep(.05)
 
         # Hide characters in local echo disabled mode (workaround).
         if not self.local_echo:
-            self.consout.FillConsoleOutputCharacter(screenbufferfillchar, len(s), startCo)
+            self.screen.fill_characters(screenbufferfillchar, len(s), startCo)
 
         return wrote
 
@@ -251,48 +335,67 @@ class ConsoleReaderBase:
         """Creates a single key record corrosponding to
             the ascii character char."""
 
-        evt = win32console.PyINPUT_RECORDType(win32console.KEY_EVENT)
-        evt.KeyDown = True
-        evt.Char = char
-        evt.RepeatCount = 1
-        return evt
+        return Win32Screen.create_key_event(char)
 
-    def initConsole(self, consout=None, window_size_x=80, window_size_y=25, buffer_size_x=80,
+    def initConsole(self, screen=None, window_size_x=80, window_size_y=25, buffer_size_x=80,
                     buffer_size_y=16000):
-        if not consout:
-            consout = self.getConsoleOut()
-
-        self.consin = win32console.GetStdHandle(win32console.STD_INPUT_HANDLE)
-
-        rect = win32console.PySMALL_RECTType(0, 0, window_size_x - 1, window_size_y - 1)
-        consout.SetConsoleWindowInfo(True, rect)
-        size = win32console.PyCOORDType(buffer_size_x, buffer_size_y)
-        consout.SetConsoleScreenBufferSize(size)
-        pos = win32console.PyCOORDType(0, 0)
+        """Sets up the screen buffer backend (the console of the child by default, see
+        wexpect.screen), clears it, and resets the read position."""
+        if not screen:
+            screen = Win32Screen(
+                self.getConsoleOut(), win32console.GetStdHandle(win32console.STD_INPUT_HANDLE))
+        self.screen = screen
+
+        screen.resize(window_size_x, window_size_y, buffer_size_x, buffer_size_y)
         # Use NUL as fill char because it displays as whitespace
         # (if we interact() with the child)
-        consout.FillConsoleOutputCharacter(screenbufferfillchar, size.X * size.Y, pos)
+        screen.fill_characters(screenbufferfillchar, buffer_size_x * buffer_size_y, Coord(0, 0))
 
-        consinfo = consout.GetConsoleScreenBufferInfo()
-        self.__consSize = consinfo['Size']
+        self.__consSize = screen.get_size()
         logger.info('self.__consSize: ' + str(self.__consSize))
-        self.startCursorPos = consinfo['CursorPosition']
+        self.startCursorPos = screen.get_cursor_position()
+
+        self.lastRead = 0
+        self.__bufferY = 0
+        self.lastReadData = ""
+        self.totalRead = 0
+        self.__currentReadCo = Coord(0, 0)
+        # The copy of the screen content, which the new output is compared to. It is updated,
+        # when there is new output.
+        self.__shadow = ScreenModel(self.__consSize.X, self.__consSize.Y)
+        self.scrolledRows = 0       # The rows scrolled out in scroll-through mode.
+        # The (start, end) offsets of the area read by the last readConsoleToCursor(), and the
+        # fingerprints of its rows, see fingerprintRows().
+        self.__lastRegion = None
+        self.__fingerprints = None
 
     def parseData(self, s):
         """Ensures that special characters are interpretted as
         newlines or blanks, depending on if there written over
         characters or screen-buffer-fill characters."""
 
-        strlist = []
-        for i, c in enumerate(s):
-            if c == screenbufferfillchar:
-                if (self.totalRead - self.lastRead + i + 1) % self.__consSize.X == 0:
-                    strlist.append('\r\n')
-            else:
-                strlist.append(c)
-
-        s = ''.join(strlist)
-        return s
+        # The fill characters in the last column of a row are line breaks, the others are
+        # dropped. s starts at the offset totalRead - lastRead, so the last columns are at every
+        # width-th index from 'first'. Slicing them out at once finds the line breaks without
+        # walking s character by character.
+        width = self.__consSize.X
+        first = -(self.totalRead - self.lastRead + 1) % width
+        lastColumn = s[first::width]
+        breaks = []
+        j = lastColumn.find(screenbufferfillchar)
+        while j >= 0:
+            breaks.append(first + j * width)
+            j = lastColumn.find(screenbufferfillchar, j + 1)
+        if not breaks:
+            return s.replace(screenbufferfillchar, '')
+
+        pieces = []
+        start = 0
+        for i in breaks:
+            pieces.append(s[start:i].replace(screenbufferfillchar, ''))
+            start = i + 1
+        pieces.append(s[start:].replace(screenbufferfillchar, ''))
+        return '\r\n'.join(pieces)
 
     def getConsoleOut(self):
         consfile = win32file.CreateFile(
@@ -304,15 +407,14 @@ class ConsoleReaderBase:
             0,
             0)
 
-        self.consout = win32console.PyConsoleScreenBufferType(consfile)
-        return self.consout
+        return win32console.PyConsoleScreenBufferType(consfile)
 
     def getCoord(self, offset):
         """Converts an offset to a point represented as a tuple."""
 
         x = offset % self.__consSize.X
         y = offset // self.__consSize.X
-        return win32console.PyCOORDType(x, y)
+        return Coord(x, y)
 
     def getOffset(self, coord):
         """Converts a tuple-point to an offset."""
@@ -328,9 +430,7 @@ class ConsoleReaderBase:
             startCo.Y = startCo.Y
 
         if endCo is None:
-            consinfo = self.consout.GetConsoleScreenBufferInfo()
-            endCo = consinfo['CursorPosition']
-            endCo = self.getCoord(0 + self.getOffset(endCo))
+            endCo = self.screen.get_cursor_position()
 
         buff = []
         self.lastRead = 0
@@ -347,7 +447,7 @@ class ConsoleReaderBase:
                 readlen = 4000
             endPoint = self.getCoord(startOff + readlen)
 
-            s = self.consout.ReadConsoleOutputCharacter(readlen, startCo)
+            s = self.screen.read_characters(readlen, startCo)
             self.lastRead += len(s)
             self.totalRead += len(s)
             buff.append(s)
@@ -356,15 +456,24 @@ class ConsoleReaderBase:
 
         return ''.join(buff)
 
+    def fingerprintRows(self, raw, startOff):
+        """Returns the fingerprints of the rows of raw, which has been read from the offset
+        startOff: the hashes of the parts of the rows in the area. A row is dirty, if its
+        fingerprint differs from the one of the last read of the same area."""
+
+        width = self.__consSize.X
+        first = width - startOff % width
+        return [hash(raw[:first])] + [hash(raw[i:i + width])
+                                      for i in range(first, len(raw), width)]
+
     def readConsoleToCursor(self):
         """Reads from the current read position to the current cursor
-        position and inserts the string into self.__buffer."""
+        position and updates the shadow copy of the screen with it."""
 
-        if not self.consout:
+        if not self.screen:
             return ""
 
-        consinfo = self.consout.GetConsoleScreenBufferInfo()
-        cursorPos = consinfo['CursorPosition']
+        cursorPos = self.screen.get_cursor_position()
 
         logger.spam('cursor: %r, current: %r' % (cursorPos, self.__currentReadCo))
 
@@ -383,17 +492,36 @@ class ConsoleReaderBase:
 
         logger.spam('cursor: %r, current: %r' % (cursorPos, self.__currentReadCo))
 
+        # The child can move the cursor anywhere (SetConsoleCursorPosition, VT sequences), so any
+        # row of the area may have been rewritten since the last read: the whole area is read.
+        region = (self.getOffset(self.__currentReadCo), self.getOffset(cursorPos))
         raw = self.readConsole(self.__currentReadCo, cursorPos)
-        rawlist = []
-        while raw:
-            rawlist.append(raw[:self.__consSize.X])
-            raw = raw[self.__consSize.X:]
-        raw = ''.join(rawlist)
+        fingerprints = self.fingerprintRows(raw, region[0])
+        if region == self.__lastRegion:
+            dirty = [y for y, (new, old) in enumerate(zip(fingerprints, self.__fingerprints))
+                     if new != old]
+        else:
+            dirty = list(range(len(fingerprints)))
+        if isSamePos and not dirty:
+            # The same area has been read as last time, and no row of it has changed: the result
+            # would be the same as last time, which was already processed.
+            logger.spam('Unchanged rows')
+            self.__currentReadCo.X = cursorPos.X
+            self.__currentReadCo.Y = cursorPos.Y
+            return ''
+        logger.spam('Dirty rows: %r' % dirty)
+        self.__lastRegion = region
+        self.__fingerprints = fingerprints
+
         s = self.parseData(raw)
-        for i, line in enumerate(reversed(rawlist)):
-            if line.endswith(screenbufferfillchar):
+        # The lines of the area are width long slices of raw (from the start of the area, the
+        # last one may be shorter). Look for the last one, which ends with the fill character.
+        width = self.__consSize.X
+        lines = -(-len(raw) // width)
+        for i in range(lines, 0, -1):
+            if raw[min(i * width, len(raw)) - 1] == screenbufferfillchar:
                 # Record the Y offset where the most recent line break was detected
-                self.__bufferY += len(rawlist) - i
+                self.__bufferY += i
                 break
 
         logger.spam('lastReadData: %r' % self.lastReadData)
@@ -406,14 +534,13 @@ class ConsoleReaderBase:
             logger.spam('isSamePos and self.lastReadData == s')
             s = ''
 
+        pos = region[0]
         if s:
             lastReadData = self.lastReadData
-            pos = self.getOffset(self.__currentReadCo)
             self.lastReadData = s
             if isSameY or not lastReadData.endswith('\r\n'):
                 # Detect changed lines
-                self.__buffer.seek(pos)
-                buf = self.__buffer.read()
+                buf = self.__shadow.read(pos, self.__shadow.end)
                 if raw.startswith(buf):
                     # Line has grown
                     rawslice = raw[len(buf):]
@@ -425,9 +552,9 @@ class ConsoleReaderBase:
                 else:
                     # Cursor has been repositioned
                     s = '\r' + s
-            self.__buffer.seek(pos)
-            self.__buffer.truncate()
-            self.__buffer.write(raw)
+            self.__shadow.write(pos, raw)
+        # The rows above __bufferY are never read again.
+        self.__shadow.trim(self.__bufferY * width)
 
         self.__currentReadCo.X = cursorPos.X
         self.__currentReadCo.Y = cursorPos.Y
@@ -440,31 +567,79 @@ class ConsoleReaderBase:
         logger.debug('Start interact window')
         win32gui.ShowWindow(win32console.GetConsoleWindow(), win32con.SW_SHOW)
 
+    def negotiate_protocol(self):
+        """Offers the supported protocol versions to the host, and waits for the chosen one."""
+
+        self.send_to_host(pack_hello(PROTOCOL_VERSIONS))
+        end_time = time.time() + self.timeout
+        while True:
+            self.frames.feed(self.get_from_host())
+            frame = self.frames.next_frame()
+            if frame is not None:
+                break
+            if end_time < time.time():
+                raise TIMEOUT('Protocol negotiation with the host has been timed out.')
+            time.sleep(.02)
+
+        kind, payload = frame
+        versions = unpack_hello(payload) if kind == FRAME_HELLO else ()
+        if len(versions) != 1 or versions[0] not in PROTOCOL_VERSIONS:
+            raise ProtocolError(f'The host has not chosen a supported protocol version: {versions}')
+        self.protocol_version = versions[0]
+        logger.info(f'Protocol version: {self.protocol_version}')
+
+    def send_frame(self, kind, payload=b''):
+        """Sends a frame to the host."""
+
+        self.send_to_host(pack_frame(kind, payload))
+
+    def send_exit_status(self):
+        """Sends the exit status, the run time and the CPU time of the child to the host, so the
+        host does not have to poll the process. Nothing is sent, if the child is still running."""
+
+        if self.child_process is None:
+            return
+        try:
+            self.child_process.wait(timeout=1)
+        except psutil.TimeoutExpired:
+            logger.info('The child is still running, the exit status is not sent.')
+            return
+        self.child_exitstatus = win32process.GetExitCodeProcess(self.__childProcess)
+        times = win32process.GetProcessTimes(self.__childProcess)
+        runtime = (times['ExitTime'] - times['CreationTime']).total_seconds()
+        cputime = (times['KernelTime'] + times['UserTime']) / 10**7     # 100 ns units
+        logger.info(f'Sending exit status: {self.child_exitstatus} runtime: {runtime}')
+        self.send_frame(
+            FRAME_EXIT_STATUS, EXIT_STATUS_PAYLOAD.pack(self.child_exitstatus, runtime, cputime))
+
+    def send_output(self, s):
+        """Sends the console output to the host in a DATA frame, and uses up the credit of the
+        flow control for it. Nothing is sent, if there is no new output."""
+
+        if s:
+            data = str.encode(s)
+            self.send_frame(FRAME_DATA, data)
+            self.flow.consume(len(data))
+
     def sendeof(self):
-        """This sends an EOF to the host. This sends a character which inform the host that child
+        """This sends an EOF to the host. This sends an EOF frame which inform the host that child
         has been finished, and all of it's output has been send to host.
         """
 
-        self.send_to_host(EOF_CHAR)
+        self.send_frame(FRAME_EOF)
 
 
 class ConsoleReaderSocket(ConsoleReaderBase):
 
     def create_connection(self, **kwargs):
+        """Connects to the host, which listens on the given port since it has started the console
+        reader."""
         try:
             self.port = kwargs['port']
-            # Create a TCP/IP socket
-            self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            server_address = ('localhost', self.port)
-            self.sock.bind(server_address)
-            logger.info(f'Socket started at port: {self.port}')
-
-            # Listen for incoming connections
-            self.sock.settimeout(5)
-            self.sock.listen(1)
-            self.connection, client_address = self.sock.accept()
+            self.host = kwargs.get('host') or default_host
+            self.connection = socket.create_connection((self.host, self.port), timeout=5)
             self.connection.settimeout(.01)
-            logger.info(f'Client connected: {client_address}')
+            logger.info(f'Connected to the host: {self.host}:{self.port}')
         except Exception as e:  # pragma: no cover
             # I hope this code is unreachable.
             logger.error(f"Port: {self.port} {e}")
@@ -507,33 +682,23 @@ class ConsoleReaderSocket(ConsoleReaderBase):
 
 
 class ConsoleReaderPipe(ConsoleReaderBase):
-    def create_connection(self, timeout=-1, **kwargs):
-        if timeout == -1:
-            timeout = self.timeout
-        if timeout is None:
-            end_time = float('inf')
-        else:
-            end_time = time.time() + timeout
-
-        pipe_name = 'wexpect_{}'.format(self.console_pid)
-        pipe_full_path = r'\\.\pipe\{}'.format(pipe_name)
-        logger.info('Start pipe server: %s', pipe_full_path)
-        self.pipe = win32pipe.CreateNamedPipe(
+    def create_connection(self, **kwargs):
+        """Opens the pipe, which has been created by the host before it started the console
+        reader."""
+        pipe_full_path = r'\\.\pipe\{}'.format(kwargs['pipe_name'])
+        logger.info('Opening pipe: %s', pipe_full_path)
+        self.pipe = win32file.CreateFile(
             pipe_full_path,
-            win32pipe.PIPE_ACCESS_DUPLEX,
-            win32pipe.PIPE_TYPE_MESSAGE | win32pipe.PIPE_READMODE_MESSAGE | win32pipe.PIPE_NOWAIT,
-            1, 65536, 65536, 10000, None)
-        logger.info("waiting for client")
-        while True:
-            if end_time < time.time():
-                raise TIMEOUT('Connect to child has been timed out.')
-            try:
-                win32pipe.ConnectNamedPipe(self.pipe, None)
-                break
-            except Exception as e:
-                logger.debug(e)
-                time.sleep(0.2)
-        logger.info('got client')
+            win32file.GENERIC_READ | win32file.GENERIC_WRITE,
+            0,
+            None,
+            win32file.OPEN_EXISTING,
+            0,
+            None
+        )
+        win32pipe.SetNamedPipeHandleState(
+            self.pipe, win32pipe.PIPE_READMODE_MESSAGE | win32pipe.PIPE_NOWAIT, None, None)
+        logger.info('Pipe opened')
 
     def close_connection(self):
         if self.pipe:
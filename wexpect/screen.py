@@ -0,0 +1,385 @@
+"""Wexpect is a Windows variant of pexpect https://pexpect.readthedocs.io.
+
+Wexpect is a Python module for spawning child applications and controlling
+them automatically.
+
+screen contains the screen buffer backends of the console reader. The console reader scrapes the
+child's output from a screen buffer: Win32Screen is the real console of the child,
+SimulatedScreen is a pure-Python console, which is driven by a ScriptedChild. The simulated
+console runs on every platform, so the scraping of the console reader can be tested and
+benchmarked without Windows.
+"""
+
+import sys
+import time
+
+if sys.platform == 'win32':
+    import win32console
+
+
+class Coord:
+    """A point of the screen buffer. It is mutable, like the PyCOORDType of pywin32."""
+
+    __slots__ = ('X', 'Y')
+
+    def __init__(self, X=0, Y=0):
+        self.X = X
+        self.Y = Y
+
+    def __eq__(self, other):
+        return self.X == other.X and self.Y == other.Y
+
+    def __repr__(self):
+        return f'Coord(X={self.X}, Y={self.Y})'
+
+
+class ScreenModel:
+    """The copy of the screen buffer content, as the console reader has read it. The content is
+    a list of fixed width rows (str), so a row is looked up in O(1), and an update touches only
+    the rows it writes. The positions are offsets (X + Y * width), like in the console reader.
+
+    The content is known between the offsets 'start' and 'end'. Writing truncates the content
+    after the written text, and pads the gap before it with NUL characters, like a StringIO does.
+    """
+
+    def __init__(self, width, height):
+        self.width = width
+        self.rows = [''] * height
+        self.start = 0
+        self.end = 0
+
+    def clear(self, start=0):
+        """Forgets the content, the next write may start at the offset start."""
+        self._clear_rows(self.start // self.width, self.end)
+        self.start = self.end = start
+
+    def _clear_rows(self, y, end):
+        for y in range(y, min(-(-end // self.width), len(self.rows))):
+            self.rows[y] = ''
+
+    def trim(self, start):
+        """Forgets the content before the offset start."""
+        if start >= self.end:
+            self.clear(start)
+        elif start > self.start:
+            self._clear_rows(self.start // self.width, start - start % self.width)
+            self.start = start
+
+    def read(self, start, end):
+        """Returns the known content between the offsets start and end."""
+        start = max(start, self.start)
+        end = min(end, self.end)
+        if start >= end:
+            return ''
+        width = self.width
+        y, x = divmod(start, width)
+        last, lastx = divmod(end, width)
+        if y == last:
+            return self.rows[y][x:lastx]
+        parts = [self.rows[y][x:]]
+        parts += self.rows[y + 1:last]
+        if lastx:
+            parts.append(self.rows[last][:lastx])
+        return ''.join(parts)
+
+    def write(self, start, s):
+        """Writes s at the offset start, and truncates the content after it."""
+        if start < self.start:
+            self.clear(start)
+        elif start > self.end:
+            s = '\0' * (start - self.end) + s
+            start = self.end
+        width = self.width
+        rows = self.rows
+        end = start + len(s)
+        y, x = divmod(start, width)
+        # The first row keeps its content before the written text (the unknown part is padded).
+        count = width - x
+        rows[y] = rows[y][:x].ljust(x, '\0') + s[:count]
+        pos = count
+        y += 1
+        while pos < len(s):
+            rows[y] = s[pos:pos + width]
+            pos += width
+            y += 1
+        self._clear_rows(y, self.end)
+        self.end = end
+
+    def char(self, offset):
+        """Returns the character at the offset."""
+        y, x = divmod(offset, self.width)
+        return self.rows[y][x]
+
+    def scroll(self, lines):
+        """Moves the content up by lines rows, like the screen buffer scrolls. The content
+        scrolled out of the top is forgotten."""
+        shift = lines * self.width
+        if shift >= self.end:
+            self.clear()
+            return
+        del self.rows[:lines]
+        self.rows.extend([''] * lines)
+        self.start = max(self.start - shift, 0)
+        self.end -= shift
+
+
+class ScreenBackend:
+    """The interface of the screen buffer backends. The coordinates are Coord instances, the
+    characters are str.
+    """
+
+    def resize(self, window_size_x, window_size_y, buffer_size_x, buffer_size_y):
+        """Sets the size of the window and the screen buffer."""
+        raise NotImplementedError
+
+    def get_size(self):
+        """Returns the size of the screen buffer as Coord."""
+        raise NotImplementedError
+
+    def get_cursor_position(self):
+        """Returns the position of the cursor as a new Coord."""
+        raise NotImplementedError
+
+    def set_cursor_position(self, coord):
+        """Moves the cursor to coord."""
+        raise NotImplementedError
+
+    def read_characters(self, length, coord):
+        """Returns length characters from coord, continuing in the next rows."""
+        raise NotImplementedError
+
+    def fill_characters(self, char, length, coord):
+        """Writes char length times from coord, continuing in the next rows. Returns the number
+        of the written cells."""
+        raise NotImplementedError
+
+    def write_characters(self, s, coord):
+        """Writes the characters of s from coord, continuing in the next rows. The cursor is not
+        moved. Returns the number of the written cells."""
+        raise NotImplementedError
+
+    def scroll(self, lines, char):
+        """Moves the content of the screen buffer up by lines rows. The rows at the bottom are
+        filled with char."""
+        raise NotImplementedError
+
+    def write_input(self, s):
+        """Writes the characters of s as key events into the input buffer. Returns the number of
+        the written events."""
+        raise NotImplementedError
+
+    def pending_input(self):
+        """Returns the number of the input events, which have not been read by the child yet."""
+        raise NotImplementedError
+
+
+class Win32Screen(ScreenBackend):
+    """The console of the child, through pywin32."""
+
+    def __init__(self, consout, consin):
+        self.consout = consout      # PyConsoleScreenBufferType of the output
+        self.consin = consin        # PyConsoleScreenBufferType of the input
+
+    @staticmethod
+    def create_key_event(char):
+        """Creates a single key record corrosponding to the character char."""
+
+        evt = win32console.PyINPUT_RECORDType(win32console.KEY_EVENT)
+        evt.KeyDown = True
+        evt.Char = char
+        evt.RepeatCount = 1
+        return evt
+
+    def resize(self, window_size_x, window_size_y, buffer_size_x, buffer_size_y):
+        rect = win32console.PySMALL_RECTType(0, 0, window_size_x - 1, window_size_y - 1)
+        self.consout.SetConsoleWindowInfo(True, rect)
+        self.consout.SetConsoleScreenBufferSize(
+            win32console.PyCOORDType(buffer_size_x, buffer_size_y))
+
+    def get_size(self):
+        size = self.consout.GetConsoleScreenBufferInfo()['Size']
+        return Coord(size.X, size.Y)
+
+    def get_cursor_position(self):
+        pos = self.consout.GetConsoleScreenBufferInfo()['CursorPosition']
+        return Coord(pos.X, pos.Y)
+
+    def set_cursor_position(self, coord):
+        self.consout.SetConsoleCursorPosition(win32console.PyCOORDType(coord.X, coord.Y))
+
+    def read_characters(self, length, coord):
+        return self.consout.ReadConsoleOutputCharacter(
+            length, win32console.PyCOORDType(coord.X, coord.Y))
+
+    def fill_characters(self, char, length, coord):
+        return self.consout.FillConsoleOutputCharacter(
+            char, length, win32console.PyCOORDType(coord.X, coord.Y))
+
+    def write_characters(self, s, coord):
+        return self.consout.WriteConsoleOutputCharacter(
+            s, win32console.PyCOORDType(coord.X, coord.Y))
+
+    def scroll(self, lines, char):
+        size = self.consout.GetConsoleScreenBufferInfo()['Size']
+        rect = win32console.PySMALL_RECTType(0, lines, size.X - 1, size.Y - 1)
+        self.consout.ScrollConsoleScreenBuffer(
+            rect, None, win32console.PyCOORDType(0, 0), char, 0)
+
+    def write_input(self, s):
+        return self.consin.WriteConsoleInput([self.create_key_event(c) for c in s])
+
+    def pending_input(self):
+        return len(self.consin.PeekConsoleInput(8))
+
+
+class SimulatedScreen(ScreenBackend):
+    """A pure-Python console. The child writes into it with put(), which handles the carriage
+    return, the line feed, the backspace, the tab and the line wrapping, and scrolls the buffer,
+    when the cursor leaves the last row, like the Windows console does. The input events are
+    queued, until the child reads them with read_input().
+
+    The screen is a list of rows, each row is a list of characters.
+    """
+
+    def __init__(self, buffer_size_x=80, buffer_size_y=16000, fillchar=' '):
+        self.fillchar = fillchar
+        self.size = Coord(buffer_size_x, buffer_size_y)
+        self.rows = [[fillchar] * buffer_size_x for _ in range(buffer_size_y)]
+        self.cursor = Coord(0, 0)
+        self.input = []
+
+    def resize(self, window_size_x, window_size_y, buffer_size_x, buffer_size_y):
+        rows = [[self.fillchar] * buffer_size_x for _ in range(buffer_size_y)]
+        for y, row in enumerate(self.rows[:buffer_size_y]):
+            rows[y][:min(buffer_size_x, self.size.X)] = row[:buffer_size_x]
+        self.rows = rows
+        self.size = Coord(buffer_size_x, buffer_size_y)
+        self.cursor = Coord(min(self.cursor.X, buffer_size_x - 1),
+                            min(self.cursor.Y, buffer_size_y - 1))
+
+    def get_size(self):
+        return Coord(self.size.X, self.size.Y)
+
+    def get_cursor_position(self):
+        return Coord(self.cursor.X, self.cursor.Y)
+
+    def set_cursor_position(self, coord):
+        self.cursor = Coord(coord.X, coord.Y)
+
+    def _cells(self, length, coord):
+        """Yields the (row, x, count) runs of length cells from coord, clipped to the buffer."""
+        x, y = coord.X, coord.Y
+        while length > 0 and y < self.size.Y:
+            count = min(length, self.size.X - x)
+            yield self.rows[y], x, count
+            length -= count
+            x = 0
+            y += 1
+
+    def read_characters(self, length, coord):
+        return ''.join(''.join(row[x:x + count]) for row, x, count in self._cells(length, coord))
+
+    def fill_characters(self, char, length, coord):
+        written = 0
+        for row, x, count in self._cells(length, coord):
+            row[x:x + count] = char * count
+            written += count
+        return written
+
+    def write_characters(self, s, coord):
+        written = 0
+        for row, x, count in self._cells(len(s), coord):
+            row[x:x + count] = s[written:written + count]
+            written += count
+        return written
+
+    def scroll(self, lines, char):
+        lines = min(lines, self.size.Y)
+        del self.rows[:lines]
+        self.rows.extend([char] * self.size.X for _ in range(lines))
+
+    def write_input(self, s):
+        self.input.extend(s)
+        return len(s)
+
+    def pending_input(self):
+        return len(self.input)
+
+    def read_input(self):
+        """Reads all queued input of the child."""
+        s = ''.join(self.input)
+        self.input.clear()
+        return s
+
+    def _line_feed(self):
+        self.cursor.X = 0
+        if self.cursor.Y + 1 < self.size.Y:
+            self.cursor.Y += 1
+        else:
+            self.scroll(1, self.fillchar)
+
+    def put(self, s):
+        """Writes the output s of the child at the cursor."""
+        width = self.size.X
+        cursor = self.cursor
+        start = 0
+        for i, c in enumerate(s):
+            if c not in '\r\n\b\t':
+                continue
+            self._put_text(s[start:i])
+            start = i + 1
+            if c == '\n':
+                self._line_feed()
+            elif c == '\r':
+                cursor.X = 0
+            elif c == '\b':
+                cursor.X = max(cursor.X - 1, 0)
+            else:
+                self._put_text(' ' * min(8 - cursor.X % 8, width - cursor.X))
+        self._put_text(s[start:])
+
+    def _put_text(self, s):
+        width = self.size.X
+        cursor = self.cursor
+        while s:
+            count = min(len(s), width - cursor.X)
+            self.rows[cursor.Y][cursor.X:cursor.X + count] = s[:count]
+            s = s[count:]
+            cursor.X += count
+            if cursor.X == width:
+                self._line_feed()
+
+
+class ScriptedChild:
+    """A child, which replays its scripted output into a SimulatedScreen at a configurable rate
+    (characters per second, None means all at once), and echoes its input, if 'echo'. Call step()
+    periodically: it writes the output, which is due by the clock.
+    """
+
+    def __init__(self, screen, output, rate=None, echo=True, clock=time.monotonic):
+        self.screen = screen
+        self.output = output
+        self.rate = rate
+        self.echo = echo
+        self.clock = clock
+        self.written = 0
+        self.start_time = clock()
+
+    def done(self):
+        """True, if the whole output has been written."""
+        return self.written >= len(self.output)
+
+    def step(self):
+        """Writes the due output, and echoes the input. Returns the number of the written
+        characters of the output."""
+        if self.echo and self.screen.input:
+            self.screen.put(self.screen.read_input())
+        if self.rate is None:
+            due = len(self.output)
+        else:
+            due = min(int((self.clock() - self.start_time) * self.rate), len(self.output))
+        s = self.output[self.written:due]
+        if s:
+            self.screen.put(s)
+            self.written = due
+        return len(s)
@@ -13,15 +13,35 @@ import traceback
 import sys
 import os
 import logging
-import signal
-
-# platform does not define VEOF so assume CTRL-D
-EOF_CHAR = b'\x04'
-
-SIGNAL_CHARS = {
-    signal.SIGTERM: b'\x011',  # Device control 1
-    signal.SIGINT: b'\x012',  # Device control 2
-}
+import struct
+import time
+
+try:
+    from re import _parser as sre_parse
+except ImportError:     # pragma: no cover
+    # Python < 3.11
+    import sre_parse
+
+# The host and the console reader talk in frames. A frame is a header (the type of the frame and the
+# length of the payload) followed by the payload. See pack_frame() and FrameDecoder.
+FRAME_HEADER = struct.Struct('<BI')
+
+FRAME_HELLO = 1         # The magic and the protocol versions offered (or chosen) at connect time.
+FRAME_DATA = 2          # Console output to the host, or keyboard input to the console reader.
+FRAME_EOF = 3           # The end of the console output. No payload.
+FRAME_SIGNAL = 4        # The signal to send to the child. See SIGNAL_PAYLOAD.
+FRAME_EXIT_STATUS = 5   # The exit status of the child. See EXIT_STATUS_PAYLOAD.
+FRAME_ACK = 6           # Grants credit for the console output. See ACK_PAYLOAD and FlowControl.
+FRAME_TYPES = frozenset(range(FRAME_HELLO, FRAME_ACK + 1))
+
+SIGNAL_PAYLOAD = struct.Struct('<i')
+# The exit code, the run time and the CPU time (in seconds) of the child.
+EXIT_STATUS_PAYLOAD = struct.Struct('<Idd')
+# The number of the bytes of DATA payloads, which the console reader may send more.
+ACK_PAYLOAD = struct.Struct('<I')
+
+PROTOCOL_MAGIC = b'WEXPECT'
+PROTOCOL_VERSIONS = (1,)
 
 SPAM = 5
 logging.addLevelName(SPAM, "SPAM")
@@ -73,6 +93,254 @@ def init_logger(logger=None):  # pragma: no cover
         logger.setLevel(logging.ERROR)
 
 
+_REPEAT_OPCODES = tuple(
+    getattr(sre_parse, name) for name in ('MAX_REPEAT', 'MIN_REPEAT', 'POSSESSIVE_REPEAT')
+    if hasattr(sre_parse, name))
+
+
+def walk_pattern(subpattern):
+    """This yields all (opcode, argument) items of a parsed (see sre_parse) regular expression,
+    including the items of the nested groups, repeats, branches and assertions."""
+
+    for op, av in subpattern:
+        yield op, av
+        if op is sre_parse.BRANCH:
+            children = av[1]
+        elif op is sre_parse.SUBPATTERN:
+            children = [av[-1]]
+        elif op in _REPEAT_OPCODES:
+            children = [av[2]]
+        elif op in (sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+            children = [av[1]]
+        elif op is sre_parse.GROUPREF_EXISTS:
+            children = [child for child in av[1:] if child is not None]
+        elif op is getattr(sre_parse, 'ATOMIC_GROUP', None):
+            children = [av]
+        else:
+            continue
+        for child in children:
+            yield from walk_pattern(child)
+
+
+def _subpattern_max_span(subpattern):
+    hi = subpattern.getwidth()[1]
+    if hi >= sre_parse.MAXREPEAT - 1:
+        return None
+    extra = 0
+    for op, av in walk_pattern(subpattern):
+        if op in (sre_parse.GROUPREF, sre_parse.GROUPREF_EXISTS):
+            return None
+        elif op is sre_parse.AT:
+            # '$' and '\b' may inspect the character after the current position.
+            extra = max(extra, 2)
+        elif op in (sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+            span = _subpattern_max_span(av[1])
+            if span is None:
+                return None
+            extra = max(extra, span + 2)
+    return hi + extra
+
+
+def pattern_max_span(pattern):
+    """This returns an upper bound of the number of characters, counted from the start of a
+    match, which the compiled regular expression 'pattern' may inspect (including lookaheads and
+    end-of-string tests) to decide if it matches at a position. This returns None if the
+    pattern is unbounded (e.g. it contains '*' or a backreference)."""
+
+    try:
+        parsed = sre_parse.parse(pattern.pattern, pattern.flags)
+    except Exception:   # pragma: no cover
+        return None
+    return _subpattern_max_span(parsed)
+
+
+def _first_chars(subpattern):
+    for op, av in subpattern:
+        if op is sre_parse.AT:
+            # zero width
+            continue
+        if op is sre_parse.LITERAL:
+            return frozenset([(op, av)])
+        if op is sre_parse.IN:
+            return frozenset([(op, tuple(av))])
+        # sre cannot use the first characters behind groups, repeats and branches of an
+        # alternation, so these are not reported.
+        return None
+    return None
+
+
+def pattern_first_chars(pattern):
+    """This returns a hashable description of the characters which can start a match of the
+    compiled regular expression 'pattern', if the pattern starts with a literal or a character set.
+    Otherwise, this returns None."""
+
+    try:
+        parsed = sre_parse.parse(pattern.pattern, pattern.flags)
+    except Exception:   # pragma: no cover
+        return None
+    return _first_chars(parsed)
+
+
+def pattern_fusable(pattern):
+    """This returns True if the compiled regular expression 'pattern' can be embedded into an
+    alternation of patterns with the same flags, without changing what it matches."""
+
+    if pattern.flags & re.VERBOSE:
+        # A comment would swallow the rest of the alternation.
+        return False
+    inline_flags = r'\(\?[aiLmsux]+\)'
+    if isinstance(pattern.pattern, bytes):
+        inline_flags = inline_flags.encode()
+    if re.search(inline_flags, pattern.pattern):
+        # Global inline flags are allowed only at the start of the expression.
+        return False
+    try:
+        parsed = sre_parse.parse(pattern.pattern, pattern.flags)
+    except Exception:   # pragma: no cover
+        return False
+    for op, _ in walk_pattern(parsed):
+        if op in (sre_parse.GROUPREF, sre_parse.GROUPREF_EXISTS):
+            # Group numbers are shifted in the alternation.
+            return False
+    return True
+
+
+def _flat_sequence(subpattern):
+    """This yields the items of 'subpattern', where the groups without scoped flags are replaced
+    by their items."""
+    for op, av in subpattern:
+        if op is sre_parse.SUBPATTERN and not av[1] and not av[2]:
+            yield from _flat_sequence(av[-1])
+        else:
+            yield op, av
+
+
+def pattern_required_literal(pattern):
+    """This returns a (literal, prefix) tuple, where 'literal' is the longest literal substring
+    which must appear in every match of the compiled regular expression 'pattern', and 'prefix' is
+    the maximum distance of the literal from the start of the match (or None if unbounded). This
+    returns None if the pattern has no such literal, or it is case-insensitive."""
+
+    if pattern.flags & re.IGNORECASE:
+        return None
+    try:
+        parsed = sre_parse.parse(pattern.pattern, pattern.flags)
+    except Exception:   # pragma: no cover
+        return None
+
+    items = list(_flat_sequence(parsed))
+    best = None
+    run_start = None
+    for i, (op, _) in enumerate(items + [(None, None)]):
+        if op is sre_parse.LITERAL:
+            if run_start is None:
+                run_start = i
+            continue
+        if run_start is not None:
+            if best is None or i - run_start > best[1] - best[0]:
+                best = (run_start, i)
+            run_start = None
+    if best is None:
+        return None
+
+    chars = [av for _, av in items[best[0]:best[1]]]
+    if isinstance(pattern.pattern, bytes):
+        literal = bytes(chars)
+    else:
+        literal = ''.join(chr(c) for c in chars)
+    prefix = sre_parse.SubPattern(parsed.state, items[:best[0]]).getwidth()[1]
+    if prefix >= sre_parse.MAXREPEAT - 1:
+        prefix = None
+    return literal, prefix
+
+
+def _ends_anchored(items, multiline):
+    items = list(_flat_sequence(items))
+    if not items:
+        return False
+    op, av = items[-1]
+    if op is sre_parse.AT:
+        return av is sre_parse.AT_END_STRING or (av is sre_parse.AT_END and not multiline)
+    if op is sre_parse.BRANCH:
+        return all(_ends_anchored(branch, multiline) for branch in av[1])
+    return False
+
+
+def pattern_tail_width(pattern):
+    """If the compiled regular expression 'pattern' can match only at the end of the string ('$'
+    or '\\Z' at its end) and its width is bounded, this returns the maximum distance of the start
+    of a match from the end of the string. Otherwise, this returns None."""
+
+    try:
+        parsed = sre_parse.parse(pattern.pattern, pattern.flags)
+    except Exception:   # pragma: no cover
+        return None
+    if not _ends_anchored(parsed, pattern.flags & re.MULTILINE):
+        return None
+    hi = parsed.getwidth()[1]
+    if hi >= sre_parse.MAXREPEAT - 1:
+        return None
+    # '$' matches before a newline at the end of the string, too.
+    return hi + 1
+
+
+def pattern_looks_behind(pattern):
+    """This returns True if the compiled regular expression 'pattern' may inspect the characters
+    before the start of its match (lookbehind, '^', '\\b', ...). The search of such a pattern from
+    an offset of a string is not equivalent to the search in the slice of the string from that
+    offset."""
+
+    try:
+        parsed = sre_parse.parse(pattern.pattern, pattern.flags)
+    except Exception:   # pragma: no cover
+        return True
+    for op, av in walk_pattern(parsed):
+        if op is sre_parse.AT and av not in (sre_parse.AT_END, sre_parse.AT_END_STRING):
+            return True
+        if op in (sre_parse.ASSERT, sre_parse.ASSERT_NOT) and av[0] < 0:
+            return True
+    return False
+
+
+def pattern_bytes_safe(pattern):
+    """This returns True if the compiled str 'pattern' finds the same matches in the UTF-8 encoded
+    text, when it is compiled for bytes. It is so if the pattern is made of ASCII characters, and
+    none of its items can match (or depends on) a single non-ASCII character, like '.', '[^a]',
+    '\\w', '\\b' or the IGNORECASE flag do. '\\d' and '\\s' are accepted only with the ASCII flag:
+    otherwise they match more in the str pattern (e.g. '\\s' matches '\\x1c'-'\\x1f'). Lookarounds are
+    not accepted either, because the match of such a pattern cannot be decoded from the matched
+    text alone (see searcher_re.decode_match())."""
+
+    if not isinstance(pattern.pattern, str) or pattern.flags & re.IGNORECASE:
+        return False
+    categories = (sre_parse.CATEGORY_DIGIT, sre_parse.CATEGORY_SPACE) if (
+        pattern.flags & re.ASCII) else ()
+    try:
+        parsed = sre_parse.parse(pattern.pattern, pattern.flags)
+    except Exception:   # pragma: no cover
+        return False
+    for op, av in walk_pattern(parsed):
+        if op in (sre_parse.ANY, sre_parse.NOT_LITERAL):
+            return False
+        if op is sre_parse.LITERAL and av > 127:
+            return False
+        if op is sre_parse.AT and av in (sre_parse.AT_BOUNDARY, sre_parse.AT_NON_BOUNDARY):
+            return False
+        if op in (sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+            return False
+        if op is sre_parse.IN:
+            for item_op, item_av in av:
+                if item_op is sre_parse.NEGATE:
+                    return False
+                if item_op is sre_parse.CATEGORY and item_av not in categories:
+                    return False
+                if item_op is sre_parse.LITERAL and item_av > 127:
+                    return False
+                if item_op is sre_parse.RANGE and item_av[1] > 127:
+                    return False
+    return True
+
+
 def split_command_line(command_line, escape_char='^'):
     """This splits a command line into a list of arguments. It splits arguments
     on spaces, but handles embedded quotes, doublequotes, and escaped
@@ -139,6 +407,234 @@ def join_args(args):
     return ' '.join(commandline)
 
 
+def pack_frame(kind, payload=b''):
+    '''Returns the frame of the given type and payload (bytes).
+    '''
+    return FRAME_HEADER.pack(kind, len(payload)) + payload
+
+
+def pack_hello(versions=PROTOCOL_VERSIONS):
+    '''Returns the HELLO frame, which offers (or chooses) the given protocol versions.
+    '''
+    return pack_frame(FRAME_HELLO, PROTOCOL_MAGIC + bytes(versions))
+
+
+def unpack_hello(payload):
+    '''Returns the protocol versions of a HELLO frame's payload.
+    '''
+    payload = bytes(payload)
+    if not payload.startswith(PROTOCOL_MAGIC):
+        raise ProtocolError(f'Invalid HELLO frame: {payload}')
+    return tuple(payload[len(PROTOCOL_MAGIC):])
+
+
+def negotiate_version(offered, supported=PROTOCOL_VERSIONS):
+    '''Returns the highest protocol version, which is both offered and supported.
+    '''
+    common = set(offered) & set(supported)
+    if not common:
+        raise ProtocolError(
+            f'No common protocol version. Offered: {offered} supported: {supported}')
+    return max(common)
+
+
+class FrameDecoder:
+    '''Splits the byte stream of the channel into frames. The stream can be fed in chunks of any
+    size, next_frame() returns a frame only when it has been completely arrived. The payloads are
+    cut by their length, the data is never scanned for special characters.
+
+    The stream is received into a preallocated buffer: the transport reads into the memoryview
+    returned by writable(), then calls commit(). The payloads are memoryviews of the same buffer, so
+    no memory is allocated per read (the buffer grows only, if a frame does not fit in it).
+    '''
+
+    def __init__(self, size=65536):
+        self.data = bytearray(size)
+        self.view = memoryview(self.data)
+        self.start = 0      # The start of the first frame, which has not been returned yet.
+        self.end = 0        # The end of the received data.
+        self.partial = 0    # The missing bytes of the DATA payload, which is being read.
+
+    def __len__(self):
+        return self.end - self.start
+
+    def writable(self, size):
+        '''Returns a memoryview of at most size bytes, to receive the stream into. The pending
+        (not returned) data is moved to the start of the buffer first, so the payloads returned
+        earlier are invalid after this call.
+        '''
+        pending = self.end - self.start
+        if self.start:
+            self.data[:pending] = self.view[self.start:self.end]
+            self.start = 0
+            self.end = pending
+        if len(self.data) < pending + size:
+            # The payload views may still be referenced, so the buffer is replaced, not resized.
+            data = bytearray(max(2 * len(self.data), pending + size))
+            data[:pending] = self.view[:pending]
+            self.data = data
+            self.view = memoryview(data)
+        return self.view[pending:pending + size]
+
+    def commit(self, size):
+        '''Appends the size bytes, which have been received into the view of writable().
+        '''
+        self.end += size
+
+    def feed(self, data):
+        '''Appends the received bytes to the stream.
+        '''
+        self.writable(len(data))[:] = data
+        self.commit(len(data))
+
+    def next_frame(self):
+        '''Returns the (type, payload) tuple of the next complete frame, or None if no complete
+        frame is available. The payload is a memoryview, which is valid until the next writable()
+        or feed() call.
+        '''
+        start = self.start + FRAME_HEADER.size
+        if self.end < start:
+            return None
+        kind, length = FRAME_HEADER.unpack_from(self.data, self.start)
+        if kind not in FRAME_TYPES:
+            raise ProtocolError(f'Unknown frame type: {kind}')
+        end = start + length
+        if self.end < end:
+            return None
+        self.start = end
+        return kind, self.view[start:end]
+
+    def ready(self):
+        '''Returns True, if read_data() can return data or handle a frame without receiving more
+        of the stream.
+        '''
+        pending = self.end - self.start
+        if self.partial:
+            return pending > 0
+        if pending < FRAME_HEADER.size:
+            return False
+        kind, length = FRAME_HEADER.unpack_from(self.data, self.start)
+        if kind == FRAME_DATA:
+            return pending > FRAME_HEADER.size
+        return pending >= FRAME_HEADER.size + length
+
+    def read_data(self, handle_frame):
+        '''Returns the arrived payload of the next DATA frame in a memoryview, which is valid until
+        the next writable() or feed() call. The other frames before it are passed to
+        handle_frame(kind, payload) in their order.
+
+        The payloads are not moved together in the buffer, that would copy the data of almost
+        every read, which spans the end of a frame. So this stops at the header of the next DATA
+        frame, and the next call returns its payload: see ready(), the transport does not have to
+        receive more of the stream before that call.
+
+        The payload of the DATA frame may be incomplete: the arrived part of it is returned, and
+        the rest by the next calls. So the data may end in a partial multibyte character.
+        Do not call next_frame() between these calls.
+        '''
+        start = end = self.start
+        while True:
+            if not self.partial:
+                if self.end - self.start < FRAME_HEADER.size:
+                    break
+                kind, length = FRAME_HEADER.unpack_from(self.data, self.start)
+                if kind != FRAME_DATA:
+                    frame = self.next_frame()
+                    if frame is None:
+                        break
+                    handle_frame(*frame)
+                    continue
+                if end > start:
+                    # The payload is returned by the next call.
+                    break
+                self.start += FRAME_HEADER.size
+                self.partial = length
+            start = self.start
+            n = min(self.partial, self.end - self.start)
+            self.start += n
+            self.partial -= n
+            end = self.start
+            if self.partial:
+                # The rest of the payload has not arrived yet.
+                break
+        return self.view[start:end]
+
+
+class FlowControl:
+    '''The send window of the console reader. The host grants credit (bytes of DATA payloads) in
+    ACK frames: the initial window after the protocol negotiation, then the size of the data it
+    has read. The sent data uses the credit up. The child is suspended while the window is
+    exhausted, and it is resumed as soon as credit arrives. The output read from the console before
+    the suspension is still sent, so the credit may go below zero.
+
+    Until the first ACK frame the window is unlimited, so a host which does not advertise a window
+    is served as before.
+
+    The time spent suspended is counted in suspend_count and suspended_time (see
+    total_suspended_time()).
+    '''
+
+    def __init__(self, suspend, resume, clock=time.monotonic):
+        self.suspend = suspend      # Suspends the child.
+        self.resume = resume        # Resumes the child.
+        self.clock = clock
+        self.credit = None          # The bytes which may be sent, None means unlimited.
+        self.closed = False
+        self.suspended = False
+        self.suspend_count = 0
+        self.suspended_time = 0.0   # The time of the finished suspensions in seconds.
+        self._suspended_at = None
+
+    def can_send(self):
+        '''Returns True, if the window is not exhausted.
+        '''
+        return self.credit is None or self.credit > 0
+
+    def grant(self, size):
+        '''Adds the credit of an ACK frame, and resumes the child, if the window is open again.
+        '''
+        if self.closed:
+            return
+        self.credit = size if self.credit is None else self.credit + size
+        self.update()
+
+    def consume(self, size):
+        '''Uses up the credit for size bytes sent, and suspends the child, if the window is
+        exhausted.
+        '''
+        if self.credit is not None:
+            self.credit -= size
+        self.update()
+
+    def update(self):
+        '''Suspends or resumes the child according to the window.
+        '''
+        if not self.can_send() and not self.suspended:
+            self.suspend()
+            self.suspended = True
+            self.suspend_count += 1
+            self._suspended_at = self.clock()
+        elif self.can_send() and self.suspended:
+            self.resume()
+            self.suspended = False
+            self.suspended_time += self.clock() - self._suspended_at
+            self._suspended_at = None
+
+    def close(self):
+        '''Makes the window unlimited, so the child is resumed, and it is not suspended any more.
+        '''
+        self.closed = True
+        self.credit = None
+        self.update()
+
+    def total_suspended_time(self):
+        '''Returns the time spent suspended in seconds, including the current suspension.
+        '''
+        if self.suspended:
+            return self.suspended_time + self.clock() - self._suspended_at
+        return self.suspended_time
+
+
 class ExceptionPexpect(Exception):
     """Base class for all exceptions raised by this module.
     """
@@ -178,4 +674,14 @@ class EOF(ExceptionPexpect):
 class TIMEOUT(ExceptionPexpect):
     """Raised when a read time exceeds the timeout. """
 
+
+class BufferOverflow(ExceptionPexpect):
+    """Raised when the read buffer exceeds the maxbuffersize of the spawn, and its overflow policy
+    is 'raise'. The buffered data is kept, the user can clear it by setting the buffer to ''."""
+
+
+class ProtocolError(ExceptionPexpect):
+    """Raised when the host and the console reader cannot understand each other: the peer sends
+    an invalid frame, or they have no common protocol version."""
+
 init_logger()